@@ -13,9 +13,11 @@ def handle_errors(func):
         try:
             return func(*args, **kwargs)
         except Exception as e:
+            # static methods have no processor to log to: their errors go to the caller
+            if not args or not isinstance(getattr(args[0], 'errors', None), list):
+                raise
             error_message = f"Error in {func.__name__ if hasattr(func, '__name__') else 'unknown method'}: {e}"
-            args[0].error_log = args[0].error_log.append({'Ошибка': error_message, 'Заявка': args[1]},
-                                                         ignore_index=True)
+            args[0].errors.append({'Ошибка': error_message, 'Заявка': args[1] if len(args) > 1 else None})
             return np.nan
 
     return wrapper
@@ -27,7 +29,15 @@ class ApplicationProcessor:
         self.managers_df = managers_df
         self.units_df = units_df
         self.unload_addresses_df = unload_addresses_df
-        self.error_log = pd.DataFrame(columns=['Ошибка', 'Заявка'])
+        # error records, made into the error log dataframe when it is saved
+        self.errors = []
+
+    @property
+    def error_log(self):
+        """
+        Error log as a dataframe
+        """
+        return pd.DataFrame(self.errors, columns=['Ошибка', 'Заявка'])
 
     @handle_errors
     def find_manager(self, text):
@@ -301,10 +311,7 @@ class ApplicationProcessor:
             self.applications_df['№ Заявки'] = self.applications_df.index + 1
 
         except Exception as e:
-            traceback_str = traceback.format_exc()
-            self.error_log = pd.concat([self.error_log, pd.DataFrame({'Ошибка': [traceback_str],
-                                                                      'Заявка': [application]})],
-                                       ignore_index=True)
+            self.errors.append({'Ошибка': traceback.format_exc(), 'Заявка': application})
 
             new_row = pd.DataFrame({'Текст заявки': [application.replace('\\n', ' ')]})
             self.applications_df = pd.concat([self.applications_df, new_row], ignore_index=True)
@@ -5,6 +5,8 @@ import traceback
 from datetime import datetime
 import functools
 
+from statements import AgentIndex, StatementRollup, StatementWriter, join_agents, read_statement_chunks
+
 
 # Error Handling Decorator
 def handle_errors(func):
@@ -13,51 +15,156 @@ def handle_errors(func):
         try:
             return func(*args, **kwargs)
         except Exception as e:
+            # static methods have no processor to log to: their errors go to the caller
+            if not args or not isinstance(getattr(args[0], 'errors', None), list):
+                raise
             error_message = f"Error in {func.__name__ if hasattr(func, '__name__') else 'unknown method'}: {e}"
-            args[0].error_log = args[0].error_log.append({'Ошибка': error_message, 'Заявка': args[1]},
-                                                         ignore_index=True)
+            args[0].errors.append({'Ошибка': error_message, 'Заявка': args[1] if len(args) > 1 else None})
             return np.nan
 
     return wrapper
 
 
+class CounterpartyRule:
+    """
+    Rule for normalizing a counterparty name: the precompiled pattern, when the rule applies
+    (by default when the pattern matches) and how the name is formatted from the match
+    """
+    def __init__(self, name, pattern, formatter, applies=None):
+        self.name = name
+        self.pattern = re.compile(pattern)
+        self.formatter = formatter
+        self.applies = applies
+
+    def match(self, row):
+        """
+        Method for checking the rule on a name: the match (or True) when the rule applies, None otherwise
+        """
+        if self.applies is not None:
+            return self.applies(row) or None
+        return self.pattern.search(row)
+
+    def format(self, match, row):
+        return self.formatter(self, match, row)
+
+
+def _quoted_name(rule, match, row):
+    # ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "ЛАГ1" => ЛАГ1, ООО: the first quoted name and the initials
+    found = rule.pattern.findall(row)
+    return '{}, {}'.format([mat[1] for mat in found if mat[1]][0], ''.join(mat[0] for mat in found if mat[0]))
+
+
+# rules in the order they are tried, the first applicable one formats the name:
+# (name, index of the pattern in the patterns list, formatter of the match, condition other than the match)
+COUNTERPARTY_RULES = [
+    ('company_brand', 5, lambda rule, m, row: '{2}, {1}, {0}'.format(*m.groups(''))),
+    ('bank_client', 1, lambda rule, m, row: '{} {}.'.format(m.group(1).capitalize(), m.group(2))),
+    ('company', 0, lambda rule, m, row: '{1}, {0}'.format(*m.groups(''))),
+    ('entrepreneur', 2, lambda rule, m, row: '{} {}.{}., {}{}'.format(m.group(3).capitalize(), m.group(4),
+                                                                       m.group(5) or '', m.group(1), m.group(2))),
+    ('entrepreneur_suffix', 3, lambda rule, m, row: '{} {}.{}., {}'.format(m.group(1).capitalize(), m.group(2),
+                                                                            m.group(3) or '', m.group(4))),
+    ('tax_office', 6, lambda rule, m, row: '{}{}{}'.format(*m.groups('')).upper()),
+    ('person', 4, lambda rule, m, row: '{} {}.{}.'.format(m.group(1).capitalize(), m.group(2), m.group(3))),
+    ('quoted', 7, _quoted_name, lambda row: '"' in row),
+    ('before_brackets', 8, lambda rule, m, row: m.group(0)),
+]
+
+
 class ReportProcessor:
     def __init__(self, account_statement_df, agents_df, patterns_list):
         self.account_statement_df = account_statement_df
         self.agents_df = agents_df
         self.patterns_list = patterns_list
-        self.error_log = pd.DataFrame(columns=['Ошибка', 'Заявка'])
+        # counterparty rules compiled once from the patterns, with the number of names each one formatted
+        self.rules = [CounterpartyRule(name, patterns_list[index], formatter, *applies)
+                      for name, index, formatter, *applies in COUNTERPARTY_RULES]
+        self.rule_hits = dict.fromkeys([rule.name for rule in self.rules] + ['unchanged'], 0)
+        # error records, made into the error log dataframe when it is saved
+        self.errors = []
+
+    @functools.cached_property
+    def agent_index(self):
+        """
+        Agents keyed by INN and by name, built on the first join
+        """
+        return AgentIndex(self.agents_df)
+
+    def join_agents(self, statement=None):
+        """
+        Method for attaching the agents to the statement rows (the whole statement by default) in one hash join:
+        returns the joined rows and the rows without an agent
+        """
+        if statement is None:
+            statement = self.account_statement_df
+        return self.agent_index.join(statement)
+
+    def join_agent_chunks(self, chunks):
+        """
+        Method for attaching the agents to statement chunks one by one: yields (joined, unmatched) per chunk
+        """
+        return join_agents(chunks, self.agent_index)
+
+    def rollup(self, statement=None):
+        """
+        Method for the monthly income and expense of the normalized counterparties of the statement
+        (a dataframe or statement chunks, the whole statement by default), for all the months in one pass
+        """
+        if statement is None:
+            statement = self.account_statement_df
+        chunks = [statement] if isinstance(statement, pd.DataFrame) else statement
+        return StatementRollup.from_chunks(chunks, key=lambda chunk: self.normalize_counterparties(chunk['Full_Name']))
+
+    @property
+    def error_log(self):
+        """
+        Error log as a dataframe
+        """
+        return pd.DataFrame(self.errors, columns=['Ошибка', 'Заявка'])
+
+    def match_rule(self, row):
+        """
+        Method for normalizing a counterparty name by the first applicable rule: (rule name, normalized name).
+        The name stays as it is when no rule applies
+        """
+        for rule in self.rules:
+            match = rule.match(row)
+            if match:
+                return rule.name, rule.format(match, row)
+        return 'unchanged', row
 
     @handle_errors
     def extract_text(self, row):
         """
-        Method for getting the manager's name by login from text
-        """
-        matches = []
-
-        for pattern in patterns:
-            match = re.findall(pattern, row)
-            matches.append(match)
-
-        return '{}, {}, {}'.format(matches[5][0][2], matches[5][0][1], matches[5][0][0]) if matches[5] else \
-                '{} {}.'.format(matches[1][0][0].capitalize(), matches[1][0][1]) if matches[1] else \
-                '{}, {}'.format(matches[0][0][1], matches[0][0][0]) if matches[0] else \
-                '{} {}.{}., {}{}'.format(matches[2][0][2].capitalize(), matches[2][0][3], matches[2][0][4],
-                                             matches[2][0][0], matches[2][0][1]) if matches[2] else \
-                '{} {}.{}., {}'.format(matches[3][0][0].capitalize(), matches[3][0][1], matches[3][0][2],
-                                               matches[3][0][3]) if matches[3] else \
-                '{}{}{}'.format(matches[6][0][0].upper(), matches[6][0][1].upper(),
-                                            matches[6][0][2]).upper() if \
-                                matches[6] else \
-                '{} {}.{}.'.format(matches[4][0][0].capitalize(), matches[4][0][1],
-                                                   matches[4][0][2]) if \
-                                    matches[4] else \
-                '{}, {}'.format([mat[1] for mat in matches[7] if mat[1]][0],
-                                                    ''.join(map(str, [mat[0] for mat in matches[7] if
-                                                                      mat[0]]))) if '"' in row else \
-                '{}'.format(matches[8][0]) if matches[8] else \
-                                            row
+        Method for normalizing a counterparty name by the first applicable rule
+        """
+        rule_name, text = self.match_rule(row)
+        self.rule_hits[rule_name] += 1
+        return text
+
+    def normalize_counterparties(self, names=None):
+        """
+        Method for normalizing a whole column of counterparty names (the statement's Full_Name by default):
+        the column is factorized, every distinct name is normalized once and the results are spread back
+        by the codes. Empty names stay empty, an error is logged once per distinct name
+        """
+        if names is None:
+            names = self.account_statement_df['Full_Name']
+        codes, uniques = pd.factorize(names)
+        counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
 
+        normalized = np.empty(len(uniques) + 1, dtype=object)
+        normalized[-1] = np.nan
+        for code, (name, count) in enumerate(zip(uniques, counts)):
+            try:
+                rule_name, normalized[code] = self.match_rule(name)
+                self.rule_hits[rule_name] += int(count)
+            except Exception as e:
+                self.errors.append({'Ошибка': f"Error in normalize_counterparties: {e}", 'Заявка': name})
+                normalized[code] = np.nan
+
+        # the code -1 of the empty names takes the last, empty element
+        return pd.Series(normalized[codes], index=names.index, name=names.name)
 
     @staticmethod
     @handle_errors
@@ -318,10 +425,7 @@ class ReportProcessor:
             self.applications_df['№ Заявки'] = self.applications_df.index + 1
 
         except Exception as e:
-            traceback_str = traceback.format_exc()
-            self.error_log = pd.concat([self.error_log, pd.DataFrame({'Ошибка': [traceback_str],
-                                                                      'Заявка': [application]})],
-                                       ignore_index=True)
+            self.errors.append({'Ошибка': traceback.format_exc(), 'Заявка': application})
 
             new_row = pd.DataFrame({'Текст заявки': [application.replace('\\n', ' ')]})
             self.applications_df = pd.concat([self.applications_df, new_row], ignore_index=True)
@@ -337,31 +441,15 @@ class ReportProcessor:
             self.error_log.to_excel(writer, sheet_name="ошибки", index=False)
 
 
-# loading data
-filename = "a022.xlsx"
-file_name = "a_022.xlsx"
-order_period = 4
-year = 2024
-organization = "Арди-а"
-months_order = ['January', 'February', 'March', 'April', 'May', 'June', 'July', 'August', 'September', 'October',
-                'November', 'December']
-list_of_months = months_order[order_period - 1:order_period]  # months_order
-sheet_name = "Выписка по счёту"
-account_statement = pd.read_excel(filename, sheet_name=sheet_name, header=10, usecols="A, C:F, K")
-account_statement = account_statement[1:]
-account_statement.columns = ['Date', 'Exp', 'Inc', 'Full_Name', 'INN', 'Purpose']
-
-agents = pd.read_csv("agents.csv")
-
 patterns = [
     # ПАО ГТС => ГТС, ПАО
-    r'^(?i)(П?АО|ООО|ГУП)(?:\s+|\s*")([^"]+)"?',
+    r'(?i)^(П?АО|ООО|ГУП)(?:\s+|\s*")([^"]+)"?',
 
     # ПАО Р-БАНК//ИЗМАЙЛОВ ВАЛЕРИЙ МИХАЙЛОВИЧ//РОССИЯ,МОСКВА Г Р/С в ПАО Р-БАНК г Москва => Измайлов В.
     r'//([\w-]+)\s+(\w)\w*\s+(?:\w)\w*//',
 
     # Индивидуальный ПРЕДПРИНИМАТЕЛЬ Логинов Андрей Николаевич => Логинов А., ИП
-    r'^(?i)(и)(?:ндивидуальный)?\s*(п)(?:редприниматель)?\s*(\w+)\s+(\w)\w*\s*(\w)?\w*',
+    r'(?i)^(и)(?:ндивидуальный)?\s*(п)(?:редприниматель)?\s*(\w+)\s+(\w)\w*\s*(\w)?\w*',
 
     # Никишкина Лидия Алексеевна (ИП) => Нокошина Л., ИП
     r'^([\w-]+)\s+(\w)\w*\s*(\w)?\w*\s*\((ИП)\)$',
@@ -373,7 +461,7 @@ patterns = [
     r'^([\w-]{2,3})\s+"?(.*)\s+"(.*)"',
 
     #  contains "ФНС":
-    r'\w*\s*(?i)(?:и?)\s*(ф)(?:едеральной)?\s*(н)(?:алоговой)?\s*(с)(?:лужбы)?\s*(?:россии)?\s*\w*\s*',
+    r'(?i)\w*\s*(?:и?)\s*(ф)(?:едеральной)?\s*(н)(?:алоговой)?\s*(с)(?:лужбы)?\s*(?:россии)?\s*\w*\s*',
 
     # ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ "ЛАГ1" => ЛАГ1, ООО
     r'(\w)\w{3,}|\"([^\"]+)\"',
@@ -383,14 +471,31 @@ patterns = [
 ]
 
 
-
-
-
-# Create an instance of ApplicationProcessor
-processor = ReportProcessor(account_statement, agents)
-
-# Process the application
-processor.process_application(application)
-
-# Save to Excel
-processor.save_to_excel(filename)
+if __name__ == '__main__':
+    # loading data
+    filename = "a022.xlsx"
+    file_name = "a_022.xlsx"
+    order_period = 4
+    year = 2024
+    organization = "Арди-а"
+    sheet_name = "Выписка по счёту"
+    filenames = [filename]
+
+    agents = pd.read_csv("agents.csv")
+
+    # Create an instance of ReportProcessor; the statements are never loaded whole, every pass reads them
+    # row by row in chunks
+    processor = ReportProcessor(None, agents, patterns)
+
+    # income and expense of every counterparty for all the months at once, the report month is a slice of them
+    rollup = processor.rollup(read_statement_chunks(filenames, sheet_name=sheet_name))
+    month_totals = rollup.month(pd.Period(year=year, month=order_period, freq='M'))
+
+    # Save to Excel: the report month, the statement rows with their agents and the rows without an agent,
+    # written chunk by chunk next to the statement (the statement itself is left as it is)
+    with StatementWriter(file_name) as writer:
+        writer.append("месяц", month_totals)
+        for joined, unmatched in processor.join_agent_chunks(read_statement_chunks(filenames, sheet_name=sheet_name)):
+            writer.append("агенты", joined)
+            writer.append("без агента", unmatched)
+        writer.append("ошибки", processor.error_log)
@@ -1,48 +1,156 @@
-import pandas as pd
-import numpy as np
+import argparse
+import os
 import re
-import traceback
+import sys
+import time
 from datetime import datetime
+from functools import cached_property, lru_cache
+
+from dictionaries import AddressHistory, Dictionaries, load_dictionaries
+from error_collector import ErrorCollector
+from instrumentation import Timings, profiled, timed
+from register_store import NumberAllocator, RegisterStore, collapse_trips, expand_trips
+
+
+# precompiled patterns of the fields
+DATE_PATTERN = re.compile(r'\d{2}\.(?:0[1-9]|1[0-2])(?:\.\d{2}(?:\d{2})?)?')
+PRODUCT_PATTERN = re.compile(r'(?i)Марка(:)?\s*(цемента)?\s*(.*?)\\n')
+PRODUCT_NOTICE_PATTERN = re.compile(r'(?i)Марка.*?\\n(.*?)\\n\d', re.DOTALL)
+NOTICE_START_PATTERN = re.compile(r'^[^0-9.].*')
+QUANTITY_PATTERN = re.compile(r'(?i)кол(\s*-\s*|ичест)?во\s*(?:\D*)(:)?\s*(\d+)')
+UNIT_PATTERN = re.compile(r'(?i)кол(-|ичест)?во\s*(?:\D*)(:)?\s*(\d+)\s*(\D+)\s*\\n\d')
+CAR_PATTERN = re.compile(r'(?i)[А-Я]{1}\d{3}[А-Я]{2}\d{3}\s*\w*')
+ORGANIZATION_PATTERN = re.compile(r'(?i)(продажа\s+от:|(продажа)?\s*от\s+(клиента)?\s*(:)?)\s*(.+?)\\n')
+PHONE_PATTERN = re.compile(r'\+?\d{1,3}[\s-]?\(?\d{3}\)?[\s-]?\d{2,3}[\s-]?\d{2}[\s-]?\d{2}')
+TIME_PATTERN = re.compile(r'(?i)(время)?\s*при(ё|е)мк(и|а)(?::)?\s*(.*?)\s*\\n')
+NOTE_PATTERN = re.compile(r'(?i)(оплата)\s*(?::)?\s*(.*?)\\n')
+UNLOAD_POINT_PATTERN = re.compile(r'(?i)\d+\.\s*(?:пункт\w*\s*разгруз\w*|точк\w*\s*выгруз\w*)\s*(?::)?\s*(.+?)\\n')
+
+# patterns of the numbered items, matched only at the items of their own section
+TRANSSHIPMENT_PATTERN = re.compile(
+    r'(?i)\d+\.\s*(С\s+(перевалки)?\s*|Завод\s*(отгрузки)?\s*(:)?|Перевалка\s*(:)?)\s*(.+?)\\n')
+PURCHASER_PATTERN = re.compile(r'(?i)\d+\.\s*(Покупатель\s*(груза)?\s*(:)?)\s*(.+?)\\n')
+CONSIGNEE_PATTERN = re.compile(
+    r'(?i)\d+\.\s*(?:Грузопол\w*\s*(?::)?|Грузопол\w*\s*\(при\s*оформ\w*\s*ттн\)\s*(?::)?)\s*(.+?)\\n')
+CONSIGNEE_LEG_ADDR_PATTERN = re.compile(
+    r'(?i)\d+\.\s*(юр\w*\s*(?:\.)?\s*адрес\s*грузополучателя|адрес\s*грузополучателя\s*\(юр\w*\s*(?:\.)?\))\s*(?::)?\s*(.+?)\\n')
+
+
+class ApplicationDocument:
+    """
+    Application text parsed once: the lowercase and compact forms and the numbered items ("3. Покупатель…")
+    of the sections the item patterns are matched at
+    """
+    # the point of a numbered item followed by the keywords of a section, the group that matched tells the section;
+    # starting at the literal point (not at the number) lets the regex engine skip to the points of the text
+    section_pattern = re.compile(r'(?i)\.(?<=\d\.)\s*(?:(с|завод|перевалк)|(покупател)|(грузопол)|(юр|адрес))')
+    section_names = ('transshipment', 'purchaser', 'consignee', 'consignee_leg_addr')
+
+    def __init__(self, text):
+        self.text = text
+
+    @classmethod
+    def of(cls, text):
+        """
+        Method for getting the parsed document of a text, parsing it only if needed
+        """
+        return text if isinstance(text, cls) else cls(text)
+
+    @cached_property
+    def lower(self):
+        return self.text.lower()
+
+    @cached_property
+    def compact(self):
+        """
+        Lowercase text without spaces, used for the dictionary lookups
+        """
+        return self.lower.replace(' ', '')
+
+    @cached_property
+    def sections(self):
+        """
+        Start positions of the numbered items, grouped by section in one regex scan of the text
+        """
+        sections = {}
+        text = self.text
+        for match in self.section_pattern.finditer(text):
+            # the item starts at the first digit of its number
+            start = match.start() - 1
+            while start and text[start - 1].isdigit():
+                start -= 1
+            sections.setdefault(self.section_names[match.lastindex - 1], []).append(start)
+        return sections
+
+    def search(self, section, pattern):
+        """
+        Method for matching a pattern only at the items of its section, first match wins
+        """
+        for start in self.sections.get(section, ()):
+            match = pattern.match(self.text, start)
+            if match:
+                return match
+        return None
 
 
 class ApplicationProcessor:
-    def __init__(self, applications_df, managers_df, units_df, unload_addresses_df):
-        self.applications_df = applications_df
+    def __init__(self, applications_df, managers_df, units_df, unload_addresses_df, products_df=None, store=None,
+                 dictionaries=None, timings=None, allocator=None):
+        """
+        With a RegisterStore the processed rows are appended to the store and applications_df is not used.
+        Otherwise the new rows of applications_df are numbered by the allocator (a NumberAllocator) after the largest
+        number of the register, existing numbers are never changed.
+        With already compiled Dictionaries the dictionary dataframes are not needed.
+        With Timings every field extraction and register operation is timed
+        """
+        # a register loaded from its workbook has a row per trip, it is kept with a row per application
+        self.applications_df = (collapse_trips(applications_df, RegisterStore.id_column, RegisterStore.trips_column)
+                                if applications_df is not None else None)
+        self.store = store
+        self.allocator = allocator
+        self.numbers_checked = False
+        self.timings = timings
         self.managers_df = managers_df
         self.units_df = units_df
         self.unload_addresses_df = unload_addresses_df
-        self.error_log = pd.DataFrame(columns=['Ошибка', 'Заявка'])
+        self.products_df = products_df
+        # errors of the extractors and the applications, flushed to the register once per batch
+        self.errors = ErrorCollector()
+
+        # dictionaries compiled once for the lookups
+        if dictionaries is None:
+            dictionaries = Dictionaries(managers_df, units_df, unload_addresses_df, products_df)
+        self.dictionaries = dictionaries
+        self.manager_index = dictionaries.manager_index
+        self.unload_address_index = dictionaries.unload_address_index
+        self.unit_table = dictionaries.unit_table
+        self.product_index = dictionaries.product_index
+        # consignee legal addresses of the register, indexed on the first search
+        self.legal_addresses = None
 
     def find_manager(self, text):
         """
         Method for getting the manager's name by login from text
         """
         try:
-            for index, row in self.managers_df.iterrows():
-                login = row['login']
-                manager = row['manager']
-
-                if login.lower().replace(' ', '') in text.lower().replace(' ', ''):
-                    return manager
-            return np.nan
+            manager = self.manager_index.find(ApplicationDocument.of(text).compact)
+            return manager
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_manager method: {e}")
-            return np.nan
+            self.errors.add('find_manager', e, text)
+            return None
 
-    @staticmethod
-    def find_dates(text):
+    def find_dates(self, text):
         """
         Method for dates extracting
         """
         try:
-            date_pattern = r'\d{2}\.(?:0[1-9]|1[0-2])(?:\.\d{2}(?:\d{2})?)?'
-            dates = re.findall(date_pattern, text)
+            dates = DATE_PATTERN.findall(text)
             return dates
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_dates method: {e}")
-            return np.nan
+            self.errors.add('find_dates', e, text)
+            return None
 
     @staticmethod
     def convert_to_full_year(date_str):
@@ -66,331 +174,706 @@ class ApplicationProcessor:
 
         return datetime_obj.strftime('%d.%m.%Y')
 
-    @staticmethod
-    def delivery_type(text):
+    def delivery_type(self, text):
         """
         Method for determining the type of delivery
         """
         try:
-            if "самовывоз" in text.lower():
+            lower = ApplicationDocument.of(text).lower
+            if "самовывоз" in lower:
                 return "самовывоз"
-            elif "автономка" in text.lower():
+            elif "автономка" in lower:
                 return "автономка доставка"
             else:
                 return "доставка"
 
         except Exception as e:
-            self.error_log.append(f"Error in the delivery_type method: {e}")
-            return np.nan
+            self.errors.add('delivery_type', e, text)
+            return None
 
-    @staticmethod
-    def find_product(text):
+    def find_product(self, text):
         """
-        Function for determining the type of product
+        Method for determining the type of product, named as in the products dictionary when it is there
         """
         try:
-            marca_match = re.search(r'(?i)Марка(:)?\s*(цемента)?\s*(.*?)\\n', text)
-            marca_value = marca_match.group(3) if marca_match else np.NAN
-            return marca_value
+            marca_match = PRODUCT_PATTERN.search(text)
+            marca_value = marca_match.group(3) if marca_match else None
+            return self.product_index.get(marca_value, marca_value)
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_product method: {e}")
-            return np.nan
+            self.errors.add('find_product', e, text)
+            return None
 
-    @staticmethod
-    def find_product_notice(text):
+    def suggest_product(self, text):
+        """
+        Method for the product of the dictionary closest to the product of the application and its score,
+        (None, 0.0) when none is similar enough; a suggestion only, the register keeps the product as written
+        """
+        marca_match = PRODUCT_PATTERN.search(text)
+        return self.product_index.suggest(marca_match.group(3) if marca_match else None)
+
+    def find_product_notice(self, text):
         """
         Function for determining the notice for the product
         """
         try:
-            intermediate_match = re.search(r'(?i)Марка.*?\\n(.*?)\\n\d', text, re.DOTALL)
-            intermediate_value = intermediate_match.group(1) if intermediate_match else np.NAN
+            intermediate_match = PRODUCT_NOTICE_PATTERN.search(text)
+            intermediate_value = intermediate_match.group(1) if intermediate_match else None
 
-            if re.match(r'^[^0-9.].*', intermediate_value):
+            if intermediate_value is not None and NOTICE_START_PATTERN.match(intermediate_value):
                 return intermediate_value
             else:
-                return np.nan
+                return None
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_product_notice method: {e}")
-            return np.nan
+            self.errors.add('find_product_notice', e, text)
+            return None
 
-    @staticmethod
-    def find_quantity(text):
+    def find_quantity(self, text):
         """
         Method for determining the product's quantity
         """
         try:
-            quantity_match = re.search(r'(?i)кол(\s*-\s*|ичест)?во\s*(?:\D*)(:)?\s*(\d+)', text)
-            quantity = int(quantity_match.group(3)) if quantity_match else np.nan
+            quantity_match = QUANTITY_PATTERN.search(text)
+            quantity = int(quantity_match.group(3)) if quantity_match else None
             return quantity
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_quantity method: {e}")
-            return np.nan
+            self.errors.add('find_quantity', e, text)
+            return None
 
     def find_unit_note(self, text):
         """
         Method for determining the quantity's unit
         """
         try:
-            unit_match = re.search(r'(?i)кол(-|ичест)?во\s*(?:\D*)(:)?\s*(\d+)\s*(\D+)\s*\\n\d', text)
-            unit = unit_match.group(4).strip() if unit_match else np.nan
+            unit_match = UNIT_PATTERN.search(text)
+            unit = unit_match.group(4).strip() if unit_match else None
 
             if unit:
-                unit_index = self.units_df[self.units_df['data'] == unit].index
-                if not unit_index.empty:
-                    unit_found = self.units_df.loc[unit_index[0], 'unit']
+                unit_found = self.unit_table.get(unit)
+                if unit_found is not None:
                     return unit_found
-            return np.nan
+            return None
 
         except Exception as e:
-            self.error_log = pd.concat(
-                [self.error_log, pd.DataFrame({'Ошибка': [f"Error in the find_unit_note method: {e}"],
-                                               'Заявка': [text]})], ignore_index=True)
-            return np.nan
+            self.errors.add('find_unit_note', e, text)
+            return None
 
-    @staticmethod
-    def find_car(text):
+    def find_car(self, text):
         """
         Method for determining the car's numbers
         """
         try:
-            car_match = re.findall(r'(?i)[А-Я]{1}\d{3}[А-Я]{2}\d{3}\s*\w*', text)
-            cars = car_match if car_match else np.NAN
+            car_match = CAR_PATTERN.findall(text)
+            cars = car_match if car_match else None
             return cars
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_purchaser method: {e}")
-            return np.nan
+            self.errors.add('find_car', e, text)
+            return None
 
-    @staticmethod
-    def find_organization(text):
+    def find_organization(self, text):
         """
         Method for determining our organization's name
         """
         try:
-            organization_match = re.search(r'(?i)(продажа\s+от:|(продажа)?\s*от\s+(клиента)?\s*(:)?)\s*(.+?)\\n', text)
-            organization = organization_match.group(5) if organization_match else np.NAN
+            organization_match = ORGANIZATION_PATTERN.search(text)
+            organization = organization_match.group(5) if organization_match else None
             return organization
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_organization method: {e}")
-            return np.nan
+            self.errors.add('find_organization', e, text)
+            return None
 
-    @staticmethod
-    def find_transshipment(text):
+    def find_transshipment(self, text):
         """
         Method for determining the transshipment's point
         """
         try:
-            transshipment_match = \
-                re.search(r'(?i)\d+\.\s*(С\s+(перевалки)?\s*|Завод\s*(отгрузки)?\s*(:)?|Перевалка\s*(:)?)\s*(.+?)\\n',
-                          text)
-            transshipment = transshipment_match.group(6) if transshipment_match else np.nan
+            transshipment_match = ApplicationDocument.of(text).search('transshipment', TRANSSHIPMENT_PATTERN)
+            transshipment = transshipment_match.group(6) if transshipment_match else None
             return transshipment
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_transshipment method: {e}")
-            return np.nan
+            self.errors.add('find_transshipment', e, text)
+            return None
 
-    @staticmethod
-    def find_purchaser(text):
+    def find_purchaser(self, text):
         """
         Method for determining the purchaser's name
         """
         try:
-            purchaser_match = re.search(r'(?i)\d+\.\s*(Покупатель\s*(груза)?\s*(:)?)\s*(.+?)\\n', text)
-            purchaser = purchaser_match.group(4) if purchaser_match else np.nan
+            purchaser_match = ApplicationDocument.of(text).search('purchaser', PURCHASER_PATTERN)
+            purchaser = purchaser_match.group(4) if purchaser_match else None
             return purchaser
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_purchaser method: {e}")
-            return np.nan
+            self.errors.add('find_purchaser', e, text)
+            return None
 
-    @staticmethod
-    def find_consignee(text):
+    def find_consignee(self, text):
         """
         Method for determining the consignee's name
         """
         try:
-            consignee_match = re.search(
-            r'(?i)\d+\.\s*(?:Грузопол\w*\s*(?::)?|Грузопол\w*\s*\(при\s*оформ\w*\s*ттн\)\s*(?::)?)\s*(.+?)\\n',
-            text)
-            consignee = consignee_match.group(1).split(':')[-1].strip() if consignee_match else np.NAN
+            consignee_match = ApplicationDocument.of(text).search('consignee', CONSIGNEE_PATTERN)
+            consignee = consignee_match.group(1).split(':')[-1].strip() if consignee_match else None
             return consignee
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_purchaser method: {e}")
-            return np.nan
+            self.errors.add('find_consignee', e, text)
+            return None
 
-    @staticmethod
-    def find_consignee_leg_addr(text):
+    def find_consignee_leg_addr(self, text):
         """
         Method for determining the legal consignee's address
         """
         try:
-            find_consignee_leg_addr_match = re.search(
-            r'(?i)\d+\.\s*(юр\w*\s*(?:\.)?\s*адрес\s*грузополучателя|адрес\s*грузополучателя\s*\(юр\w*\s*(?:\.)?\))\s*(?::)?\s*(.+?)\\n',
-            text)
-            find_consignee_leg_addr = find_consignee_leg_addr_match.group(2) if find_consignee_leg_addr_match else np.NAN
+            find_consignee_leg_addr_match = \
+                ApplicationDocument.of(text).search('consignee_leg_addr', CONSIGNEE_LEG_ADDR_PATTERN)
+            find_consignee_leg_addr = find_consignee_leg_addr_match.group(2) if find_consignee_leg_addr_match else None
             return find_consignee_leg_addr
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_consignee_leg_addr method: {e}")
-            return np.nan
+            self.errors.add('find_consignee_leg_addr', e, text)
+            return None
 
     def find_unl_addr(self, text):
         """
-        Method for determining unload addresses
+        Method for determining unload addresses: the name and the place of an address both occur in the text
         """
         try:
-            for index, row in self.unload_addresses_df.iterrows():
-                pattern1 = row['name']
-                pattern2 = row['place']
-                address = row['address']
-
-                if pattern1.lower().replace(' ', '') and pattern2.lower().replace(' ', '') \
-                        in text.lower().replace(' ', ''):
-                    return address
-            return np.nan
+            return self.unload_address_index.find(ApplicationDocument.of(text).compact)
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_unl_addr method: {e}")
-            return np.nan
+            self.errors.add('find_unl_addr', e, text)
+            return None
 
-    @staticmethod
-    def find_phones(text):
+    def suggest_unl_addr(self, text, limit=5):
+        """
+        Method for the unload addresses of the dictionary whose name is similar to the consignee of the application
+        and whose place is similar to its unload point: [(address, score)] from the best, [] without those items;
+        suggestions only, the register keeps the exact match
+        """
+        document = ApplicationDocument.of(text)
+        consignee_match = document.search('consignee', CONSIGNEE_PATTERN)
+        unload_point_match = UNLOAD_POINT_PATTERN.search(document.text)
+        if not consignee_match or not unload_point_match:
+            return []
+        return self.unload_address_index.candidates(consignee_match.group(1), unload_point_match.group(1), limit)
+
+    def legal_address_candidates(self, address, limit=5):
+        """
+        Method for the consignee legal addresses of the register similar to the address: [(address, score)]
+        """
+        if self.legal_addresses is None:
+            if self.store is not None:
+                history = self.store.values(LEGAL_ADDRESS_COLUMN)
+            elif self.applications_df is not None and LEGAL_ADDRESS_COLUMN in self.applications_df.columns:
+                history = self.applications_df[LEGAL_ADDRESS_COLUMN]
+            else:
+                history = ()
+            self.legal_addresses = AddressHistory(history)
+        return self.legal_addresses.candidates(address, limit)
+
+    def find_phones(self, text):
         """
         Method for determining the phone numbers
         """
         try:
-            phone_numbers = re.findall(r'\+?\d{1,3}[\s-]?\(?\d{3}\)?[\s-]?\d{2,3}[\s-]?\d{2}[\s-]?\d{2}', text)
-            phone_numbers = phone_numbers if phone_numbers else np.NAN
+            phone_numbers = PHONE_PATTERN.findall(text)
+            phone_numbers = phone_numbers if phone_numbers else None
             return phone_numbers
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_phones method: {e}")
-            return np.nan
+            self.errors.add('find_phones', e, text)
+            return None
 
-    @staticmethod
-    def find_time(text):
+    def find_time(self, text):
         """
         Method for determining the unloading time
         """
         try:
-            time_match = re.search(r'(?i)(время)?\s*при(ё|е)мк(и|а)(?::)?\s*(.*?)\s*\\n', text)
-            time = time_match.group(4) if time_match else np.NAN
+            time_match = TIME_PATTERN.search(text)
+            time = time_match.group(4) if time_match else None
             return time
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_time method: {e}")
-            return np.nan
+            self.errors.add('find_time', e, text)
+            return None
 
-    @staticmethod
-    def find_note(text):
+    def find_note(self, text):
         """
         Method for determining the note
         """
         try:
-            if 'оплата' in text.lower():
-                note_match = re.search(r'(?i)(оплата)\s*(?::)?\s*(.*?)\\n', text)
-                note = '{} {}'.format(note_match.group(1).strip(), note_match.group(2).strip() if note_match else np.nan)
+            document = ApplicationDocument.of(text)
+            if 'оплата' in document.lower:
+                note_match = NOTE_PATTERN.search(document.text)
+                note = '{} {}'.format(note_match.group(1).strip(), note_match.group(2).strip() if note_match else None)
                 return note
             else:
-                return np.nan
+                return None
 
         except Exception as e:
-            self.error_log.append(f"Error in the find_note method: {e}")
-            return np.nan
+            self.errors.add('find_note', e, text)
+            return None
 
-    def process_application(self, application):
+    def extract_row(self, application, columns=None):
         """
-        Method to process an application and update the dataframe
+        Method to extract the register row of an application with its number of trips in the 'Рейсов' column.
+        Only the fields of the given columns and their dependencies are extracted
         """
+        document = ApplicationDocument(application)
+        fields, output = field_plan(None if columns is None else tuple(columns))
+
+        found = {}
+        timings = self.timings
+        field = None
         try:
-            manager_found = self.find_manager(application)
-            found_dates = ApplicationProcessor.find_dates(application)
-            if found_dates:
-                formatted_date = self.convert_to_full_year(found_dates[0])
+            if timings is None:
+                for field in fields:
+                    found[field.name] = field.extract(self, document, found)
             else:
-                formatted_date = np.nan
-            delivery_found = self.delivery_type(application)
-            product_found = self.find_product(application)
-            product_notice_found = self.find_product_notice(application)
-            quantity_found = self.find_quantity(application)
-            unit_found = self.find_unit_note(application)
-            num_str = round(quantity_found / 35 if unit_found == 'т' else quantity_found / 40)
-            cars_found = ', '.join(self.find_car(application)) if self.find_car(application) is not np.nan else np.nan
-            organization_found = self.find_organization(application)
-            transshipment_found = self.find_transshipment(application)
-            purchaser_found = self.find_purchaser(application)
-            consignee_found = self.find_consignee(application)
-            consignee_leg_addr_found = self.find_consignee_leg_addr(application)
-            unl_addr_found = self.find_unl_addr(application)
-            phones_found = ', '.join(self.find_phones(application)) if self.find_phones(application) is not np.nan else np.nan
-            accept_time_found = self.find_time(application)
-            note_found = self.find_note(application)
-
-
-            new_row = pd.DataFrame({'Менеджер': [manager_found],
-                                    'Дата': [formatted_date],
-                                    'Вид доставки': [delivery_found],
-                                    'Товар': [product_found],
-                                    'Примечание к Товару': [product_notice_found],
-                                    'Кол-во': [35 if unit_found == 'т' else 40],
-                                    'Ед.изм.': [unit_found],
-                                    'Машина/Водитель': [cars_found],
-                                    'Продавец': [organization_found],
-                                    'Откуда': [transshipment_found],
-                                    'Покупатель': [purchaser_found],
-                                    'Грузополучатель': [consignee_found],
-                                    'Юр. адрес грузополучателя': [consignee_leg_addr_found],
-                                    'Адрес пункта разгрузки': [unl_addr_found],
-                                    'Контакт гп': [phones_found],
-                                    'Время приемки': [accept_time_found],
-                                    'Примечание Иное': [note_found],
-                                    'Текст заявки': [application.replace('\\n', ' ')]})
-
-            new_rows = pd.concat([new_row] * num_str, ignore_index=True)
-            self.applications_df = pd.concat([self.applications_df, new_rows], ignore_index=True)
-            self.applications_df['№ Заявки'] = self.applications_df.index + 1
-
+                # the parts of the document are built lazily and count in the first field needing them
+                clock = time.perf_counter_ns
+                for field in fields:
+                    started = clock()
+                    try:
+                        found[field.name] = field.extract(self, document, found)
+                    finally:
+                        timings.add(field.name, clock() - started)
         except Exception as e:
-            traceback_str = traceback.format_exc()
-            self.error_log = pd.concat([self.error_log, pd.DataFrame({'Ошибка': [traceback_str],
-                                                                      'Заявка': [application]})],
-                                       ignore_index=True)
+            raise FieldError(field.name, e) from e
+        new_row = {column: found[name] for column, name in output}
+        new_row[TRIPS_COLUMN] = found['trips']
 
-            new_row = pd.DataFrame({'Текст заявки': [application]})
-            self.applications_df = pd.concat([self.applications_df, new_row], ignore_index=True)
-            self.applications_df['№ Заявки'] = self.applications_df.index + 1
+        return new_row
 
-    def save_to_excel(self, filename):
+    def extract_rows(self, application, columns=None):
         """
-        Method to save the dataframe and error log to Excel
+        Method to extract the rows of an application, one row per trip
+        """
+        new_row = self.extract_row(application, columns)
+        return [new_row] * new_row[TRIPS_COLUMN]
+
+    def extract_batch(self, applications, columns=None, jobs=1, chunk_size=200, columnar=False):
+        """
+        Method to extract the rows of a batch of applications, collecting the errors separately.
+        With jobs other than 1 the applications are extracted by a process pool (jobs=0: one process per core),
+        with columnar the whole batch is extracted column by column with pandas
+        """
+        if columns is not None:
+            columns = tuple(columns)
+            field_plan(columns)
+        if columnar:
+            import columnar as columnar_extraction
+
+            return columnar_extraction.extract_batch(self, applications, columns)
+        if jobs != 1:
+            return self.extract_parallel(applications, columns, jobs, chunk_size)
+
+        count = 0
+        rows = []
+        errors = []
+        failed = []
+
+        for application in applications:
+            count += 1
+            try:
+                rows.append(self.extract_row(application, columns))
+
+            except FieldError as e:
+                errors.append(self.errors.record(e.field, e.error, application))
+                failed.append(count - 1)
+                rows.append({'Текст заявки': application})
+
+        return count, rows, errors, failed
+
+    def extract_parallel(self, applications, columns=None, jobs=0, chunk_size=200):
+        """
+        Method to extract a batch in a process pool: chunks of applications go to the processes
+        and the results are merged back in the input order, exactly as the serial extraction would give them
         """
+        from concurrent.futures import ProcessPoolExecutor
 
-        with pd.ExcelWriter(filename) as writer:
-            self.applications_df.to_excel(writer, sheet_name="data", index=False)
-            self.error_log.to_excel(writer, sheet_name="ошибки", index=False)
+        count = 0
+        rows = []
+        errors = []
+        failed = []
 
+        with ProcessPoolExecutor(max_workers=jobs or os.cpu_count(), initializer=_init_pool_worker,
+                                 initargs=(self.dictionaries, self.timings is not None)) as executor:
+            chunks = ((chunk, columns) for chunk in _chunks(applications, chunk_size))
+            for chunk_count, chunk_rows, chunk_errors, chunk_failed, logged, stats in \
+                    executor.map(_extract_chunk, chunks):
+                failed.extend(count + index for index in chunk_failed)
+                count += chunk_count
+                rows.extend(chunk_rows)
+                # the errors are counted and sampled here, in the input order, as the serial extraction does
+                errors.extend(self.errors.replay(record) for record in chunk_errors)
+                self.errors.extend(self.errors.replay(record) for record in logged)
+                if stats:
+                    self.timings.merge(stats)
 
-# loading dictionaries
-filename = "appl_register.xlsx"
-applications = pd.read_excel(filename, sheet_name="data")
-managers = pd.read_excel("dictionary.xlsx", sheet_name="managers")
-units = pd.read_excel("dictionary.xlsx", sheet_name="units")
-unload_addresses = pd.read_excel("dictionary.xlsx", sheet_name="unload_addresses")
+        return count, rows, errors, failed
 
-# entering an application
-application = str(input('Введите заявку: '))
+    def extract_frame(self, applications, columns=None):
+        """
+        Method to extract only the given columns of a batch of applications, one row per trip,
+        leaving the register as is: returns the dataframe and the error records of the batch
+        """
+        start = len(self.errors)
+        count, rows, errors, failed = self.extract_batch(applications, columns)
+        # the errors the extractors buffered go back with the rows, not into the next appended batch
+        errors = self.errors.drain(start) + list(errors)
+
+        import pandas as pd
+
+        columns = list(columns) if columns is not None else COLUMNS
+        frame = pd.DataFrame(rows, columns=columns + [TRIPS_COLUMN] if TRIPS_COLUMN not in columns else columns)
+        return expand_trips(frame, TRIPS_COLUMN)[columns], errors
+
+    def extract_series(self, applications, columns=None):
+        """
+        Method to extract a pandas Series of applications column by column into a dataframe of the register
+        columns (one row per trip), leaving the register as is: returns the dataframe and the error records
+        """
+        import columnar
 
-# Create an instance of ApplicationProcessor
-processor = ApplicationProcessor(applications, managers, units, unload_addresses)
+        return columnar.extract_series(self, applications, columns)
 
-# Process the application
-processor.process_application(application)
+    def process_many(self, applications, jobs=1, chunk_size=200, columnar=False):
+        """
+        Method to process a batch of applications and update the dataframe (or the store) once per batch
+        """
+        started = time.perf_counter()
+        count, rows, errors, failed = self.extract_batch(applications, jobs=jobs, chunk_size=chunk_size,
+                                                         columnar=columnar)
+        self.append_batch(rows, errors)
+
+        seconds = time.perf_counter() - started
+        return {'applications': count,
+                'rows': len(rows),
+                'trips': sum(row.get(TRIPS_COLUMN) or 1 for row in rows),
+                'errors': len(errors),
+                'failed': failed,
+                'seconds': seconds,
+                'per_second': count / seconds if seconds else 0.0}
+
+    def append_batch(self, rows, errors=()):
+        """
+        Method to append extracted rows and errors to the dataframe (or the store); returns the numbers of the rows
+        """
+        self.log_errors(errors)
+        if self.legal_addresses is not None:
+            self.legal_addresses.extend(row.get(LEGAL_ADDRESS_COLUMN) for row in rows)
 
-# Save to Excel
-processor.save_to_excel(filename)
+        with timed(self.timings, 'save_register'):
+            if self.store is not None:
+                numbers = self.store.append(rows)
+                self.store.append_errors(self.errors.drain())
+                return numbers
+
+            if not rows:
+                return []
+
+            import pandas as pd
+
+            if self.allocator is None:
+                self.allocator = NumberAllocator()
+            # the first numbers continue after the largest one of the loaded register
+            numbers = self.allocator.allocate(len(rows), 0 if self.numbers_checked else self.largest_number())
+            self.numbers_checked = True
+
+            new_rows = pd.DataFrame(rows)
+            new_rows.insert(0, RegisterStore.id_column, numbers)
+            self.applications_df = pd.concat([self.applications_df, new_rows], ignore_index=True)
+            return numbers
+
+    def largest_number(self):
+        """
+        Method for getting the largest application number of the dataframe register, 0 if there is none
+        """
+        if self.applications_df is None or RegisterStore.id_column not in self.applications_df.columns:
+            return 0
+        largest = self.applications_df[RegisterStore.id_column].max()
+        return 0 if largest != largest else int(largest)
+
+    def log_errors(self, errors):
+        """
+        Method to add error records (dicts with 'Ошибка' and 'Заявка') to the error log
+        """
+        self.errors.extend(errors)
+
+    @property
+    def error_log(self):
+        """
+        Error log as a dataframe
+        """
+        import pandas as pd
+
+        return pd.DataFrame(self.errors.records, columns=ErrorCollector.columns)
+
+    def process_application(self, application):
+        """
+        Method to process an application and update the dataframe
+        """
+        return self.process_many([application])
+
+    def save_to_excel(self, filename):
+        """
+        Method to save the dataframe and error log to Excel
+        """
+        with timed(self.timings, 'export_excel'):
+            if self.store is not None:
+                self.store.export_excel(filename)
+                return
+
+            import pandas as pd
+
+            with pd.ExcelWriter(filename) as writer:
+                expand_trips(self.applications_df, TRIPS_COLUMN).to_excel(writer, sheet_name="data", index=False)
+                self.error_log.to_excel(writer, sheet_name="ошибки", index=False)
+
+
+class FieldError(Exception):
+    """
+    Failure of an application on one of its fields: the name of the field and the original exception
+    """
+    def __init__(self, field, error):
+        super().__init__(f"{field}: {type(error).__name__}: {error}")
+        self.field = field
+        self.error = error
+
+
+# processor of a pool process, created once per process from the compiled dictionaries
+_pool_processor = None
+
+
+def _init_pool_worker(dictionaries, timed_fields=False):
+    global _pool_processor
+    _pool_processor = ApplicationProcessor(None, None, None, None, dictionaries=dictionaries,
+                                           timings=Timings() if timed_fields else None)
+    # the errors go back bare, the parent counts them and keeps the tracebacks of the first ones
+    _pool_processor.errors = ErrorCollector(bare=True)
+
+
+def _extract_chunk(task):
+    applications, columns = task
+    count, rows, errors, failed = _pool_processor.extract_batch(applications, columns)
+    logged = _pool_processor.errors.drain()
+    # every chunk formats the tracebacks of the first errors of its own kinds, the parent picks among them
+    _pool_processor.errors.counts = {}
+    stats = None
+    if _pool_processor.timings is not None:
+        stats, _pool_processor.timings.stats = _pool_processor.timings.stats, {}
+    return count, rows, errors, failed, logged, stats
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class FieldSpec:
+    """
+    Field of an application: the register column it fills, how it is extracted
+    and which fields have to be extracted before it
+    """
+    def __init__(self, name, extract, column=None, requires=()):
+        self.name = name
+        self.extract = extract
+        self.column = column
+        self.requires = tuple(requires)
+
+
+def _format_date(processor, document, found):
+    dates = found['dates']
+    return processor.convert_to_full_year(dates[0]) if dates else None
+
+
+def _count_trips(processor, document, found):
+    quantity, unit = found['quantity'], found['unit']
+    num_str = round(quantity / 35 if unit == 'т' else quantity / 40)
+    if num_str < 1:
+        raise ValueError(f"The quantity {quantity} is less than one trip")
+    return num_str
+
+
+def _join(values):
+    return ', '.join(values) if values is not None else None
+
+
+TRIPS_COLUMN = RegisterStore.trips_column
+LEGAL_ADDRESS_COLUMN = 'Юр. адрес грузополучателя'
+
+# fields in the order of the register columns; 'trips' is always extracted, the rows are expanded by it on export
+FIELDS = {field.name: field for field in [
+    FieldSpec('manager', lambda p, d, f: p.find_manager(d), 'Менеджер'),
+    FieldSpec('dates', lambda p, d, f: p.find_dates(d.text)),
+    FieldSpec('date', _format_date, 'Дата', requires=['dates']),
+    FieldSpec('delivery', lambda p, d, f: p.delivery_type(d), 'Вид доставки'),
+    FieldSpec('product', lambda p, d, f: p.find_product(d.text), 'Товар'),
+    FieldSpec('product_notice', lambda p, d, f: p.find_product_notice(d.text), 'Примечание к Товару'),
+    FieldSpec('quantity', lambda p, d, f: p.find_quantity(d.text)),
+    FieldSpec('load', lambda p, d, f: 35 if f['unit'] == 'т' else 40, 'Кол-во', requires=['unit']),
+    FieldSpec('unit', lambda p, d, f: p.find_unit_note(d.text), 'Ед.изм.'),
+    FieldSpec('trips', _count_trips, TRIPS_COLUMN, requires=['quantity', 'unit']),
+    FieldSpec('cars', lambda p, d, f: _join(p.find_car(d.text)), 'Машина/Водитель'),
+    FieldSpec('organization', lambda p, d, f: p.find_organization(d.text), 'Продавец'),
+    FieldSpec('transshipment', lambda p, d, f: p.find_transshipment(d), 'Откуда'),
+    FieldSpec('purchaser', lambda p, d, f: p.find_purchaser(d), 'Покупатель'),
+    FieldSpec('consignee', lambda p, d, f: p.find_consignee(d), 'Грузополучатель'),
+    FieldSpec('consignee_leg_addr', lambda p, d, f: p.find_consignee_leg_addr(d), LEGAL_ADDRESS_COLUMN),
+    FieldSpec('unl_addr', lambda p, d, f: p.find_unl_addr(d), 'Адрес пункта разгрузки'),
+    FieldSpec('phones', lambda p, d, f: _join(p.find_phones(d.text)), 'Контакт гп'),
+    FieldSpec('time', lambda p, d, f: p.find_time(d.text), 'Время приемки'),
+    FieldSpec('note', lambda p, d, f: p.find_note(d), 'Примечание Иное'),
+    FieldSpec('text', lambda p, d, f: d.text.replace('\\n', ' '), 'Текст заявки'),
+]}
+COLUMNS = [field.column for field in FIELDS.values() if field.column]
+COLUMN_FIELDS = {field.column: field.name for field in FIELDS.values() if field.column}
+
+
+@lru_cache(maxsize=None)
+def field_plan(columns=None):
+    """
+    Function for ordering the fields needed for the columns, dependencies first.
+    Returns the fields to extract and the (column, field) pairs of the output row
+    """
+    if columns is None:
+        columns = tuple(COLUMNS)
+    unknown = [column for column in columns if column not in COLUMN_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+
+    fields = []
+    done = set()
+    visiting = set()
+
+    def visit(name):
+        if name in done:
+            return
+        if name in visiting:
+            raise ValueError(f"Circular dependency of the field {name}")
+        visiting.add(name)
+        for dependency in FIELDS[name].requires:
+            visit(dependency)
+        visiting.discard(name)
+        done.add(name)
+        fields.append(FIELDS[name])
+
+    wanted = {COLUMN_FIELDS[column] for column in columns} | {'trips'}
+    for name in FIELDS:
+        if name in wanted:
+            visit(name)
+
+    return fields, [(column, COLUMN_FIELDS[column]) for column in columns]
+
+
+def read_applications(stream):
+    """
+    Function for reading applications from a text stream, one application per line
+    (line breaks inside an application are written as \\n, the same way they are pasted into input())
+    """
+    for line in stream:
+        line = line.rstrip('\r\n')
+        if line.strip():
+            yield line
+
+
+def open_store(store_path, register, timings=None):
+    """
+    Function for opening the register store, moving the register workbook into it on the first run
+    """
+    with timed(timings, 'load_register'):
+        store = RegisterStore(store_path, COLUMNS)
+        if not store.count() and os.path.exists(register):
+            import pandas as pd
+
+            sheets = pd.read_excel(register, sheet_name=None)
+            store.import_frame(sheets["data"], sheets.get("ошибки"))
+    return store
+
+
+def load_processor(dictionary='dictionary.xlsx', store=None, timings=None):
+    """
+    Function for creating an ApplicationProcessor with the dictionaries loaded from their compiled snapshot
+    """
+    # loading dictionaries
+    with timed(timings, 'load_dictionaries'):
+        dictionaries = load_dictionaries(dictionary)
+
+    return ApplicationProcessor(None, None, None, None, store=store, dictionaries=dictionaries, timings=timings)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Обработка заявок')
+    parser.add_argument('source', nargs='?',
+                        help="файл с заявками, по одной в строке, или '-' для stdin; "
+                             "без аргумента заявка вводится вручную")
+    parser.add_argument('--store', default='appl_register.sqlite', help='хранилище реестра заявок (SQLite)')
+    parser.add_argument('--register', default='appl_register.xlsx',
+                        help='реестр заявок в Excel: переносится в хранилище при первом запуске и '
+                             'используется для выгрузки')
+    parser.add_argument('--export', action='store_true', help='выгрузить реестр из хранилища в Excel')
+    parser.add_argument('--dictionary', default='dictionary.xlsx', help='справочники')
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='число процессов для разбора пакета заявок (0 - по числу ядер)')
+    parser.add_argument('--columnar', action='store_true',
+                        help='разбирать пакет целиком по столбцам (pandas), быстрее для больших пакетов')
+    parser.add_argument('--timings', nargs='?', const='', metavar='FILE',
+                        help='замерять время каждого поля и работы с реестром; сводка сохраняется в FILE '
+                             '(.xlsx или JSON, по умолчанию рядом с реестром)')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='разбор пакета под cProfile, статистика сохраняется в FILE '
+                             '(при --jobs замеряется только основной процесс)')
+    args = parser.parse_args(argv)
+
+    timings = Timings() if args.timings is not None else None
+    store = open_store(args.store, args.register, timings)
+
+    if args.source is not None or not args.export:
+        # Create an instance of ApplicationProcessor
+        processor = load_processor(args.dictionary, store, timings)
+
+        if args.source is None:
+            # entering an application
+            application = str(input('Введите заявку: '))
+            processor.process_application(application)
+        else:
+            # processing the whole backlog as one batch
+            with profiled(args.profile):
+                if args.source == '-':
+                    stats = processor.process_many(read_applications(sys.stdin), jobs=args.jobs,
+                                                   columnar=args.columnar)
+                else:
+                    with open(args.source, encoding='utf-8') as file:
+                        stats = processor.process_many(read_applications(file), jobs=args.jobs,
+                                                       columnar=args.columnar)
+            print(f"Заявок: {stats['applications']}, рейсов: {stats['trips']}, ошибок: {stats['errors']}, "
+                  f"{stats['seconds']:.2f} с ({stats['per_second']:.1f} заявок/с)", file=sys.stderr)
+            for row in processor.errors.summary():
+                print(f"  {row['Источник']}: {row['Тип ошибки']} x{row['Количество']}", file=sys.stderr)
+
+    # Export to Excel on demand
+    if args.export:
+        with timed(timings, 'export_excel'):
+            store.export_excel(args.register)
+    store.close()
+
+    if timings is not None:
+        timings.report()
+        timings.save(args.timings or os.path.splitext(args.register)[0] + '_timings.json')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,210 @@
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from applic import COLUMNS, ApplicationDocument, ApplicationProcessor
+from dictionaries import load_dictionaries
+from register_store import RegisterStore
+from synthetic import generate_applications, generate_counterparties
+
+EXTRACTORS = ['find_manager', 'find_dates', 'delivery_type', 'find_product', 'find_product_notice', 'find_quantity',
+              'find_unit_note', 'find_car', 'find_organization', 'find_transshipment', 'find_purchaser',
+              'find_consignee', 'find_consignee_leg_addr', 'find_unl_addr', 'find_phones', 'find_time', 'find_note']
+
+
+def percentile(sorted_values, share):
+    """
+    Function for getting a percentile of sorted values (nearest rank)
+    """
+    return sorted_values[min(len(sorted_values) - 1, int(share * len(sorted_values)))]
+
+
+def measure(name, func, inputs, repeat=3):
+    """
+    Function for timing every call of func over the inputs, after one untimed pass to warm up the caches.
+    An exception counts as an error of the call, the timing of the call is kept
+    """
+    for value in inputs:
+        try:
+            func(value)
+        except Exception:
+            pass
+
+    clock = time.perf_counter_ns
+    timings = []
+    errors = 0
+    for _ in range(repeat):
+        for value in inputs:
+            started = clock()
+            try:
+                func(value)
+            except Exception:
+                errors += 1
+            timings.append(clock() - started)
+
+    timings.sort()
+    total = sum(timings)
+    return {'name': name,
+            'calls': len(timings),
+            'errors': errors,
+            'total_ms': round(total / 1e6, 3),
+            'mean_us': round(total / len(timings) / 1e3, 3),
+            'min_us': round(timings[0] / 1e3, 3),
+            'p50_us': round(percentile(timings, 0.5) / 1e3, 3),
+            'p95_us': round(percentile(timings, 0.95) / 1e3, 3),
+            'max_us': round(timings[-1] / 1e3, 3)}
+
+
+def load_report_processor():
+    """
+    Function for importing ReportProcessor and its patterns from 20240515_mya.py (the file name is not a module name)
+    """
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '20240515_mya.py')
+    spec = importlib.util.spec_from_file_location('report_processing', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.ReportProcessor, module.patterns
+
+
+def selected(name, only):
+    """
+    Function for checking whether a benchmark was asked for (all of them without a selection)
+    """
+    return not only or name in only
+
+
+def benchmark_extractors(processor, applications, repeat, only=None):
+    """
+    Function for timing the parsing of the document and every extractor on the raw application texts
+    """
+    results = []
+    if selected('ApplicationDocument', only):
+        results.append(measure('ApplicationDocument', lambda text: ApplicationDocument(text).sections,
+                               applications, repeat))
+    for name in EXTRACTORS:
+        if selected(name, only):
+            results.append(measure(name, getattr(processor, name), applications, repeat))
+    return results
+
+
+def benchmark_end_to_end(dictionaries, applications, repeat, only=None):
+    """
+    Function for timing the extraction of the register rows and process_application with a temporary store
+    """
+    results = []
+    if selected('extract_rows', only):
+        processor = ApplicationProcessor(None, None, None, None, dictionaries=dictionaries)
+        results.append(measure('extract_rows', processor.extract_rows, applications, repeat))
+    if not selected('process_application', only):
+        return results
+
+    with tempfile.TemporaryDirectory() as folder:
+        store = RegisterStore(os.path.join(folder, 'register.sqlite'), COLUMNS)
+        try:
+            processor = ApplicationProcessor(None, None, None, None, store=store, dictionaries=dictionaries)
+            results.append(measure('process_application', processor.process_application, applications, repeat))
+        finally:
+            store.close()
+    return results
+
+
+def benchmark_report(names, repeat, only=None):
+    """
+    Function for timing ReportProcessor.extract_text on counterparty names; skipped without pandas
+    """
+    if not selected('ReportProcessor.extract_text', only):
+        return []
+    try:
+        report_processor, patterns = load_report_processor()
+    except ImportError as e:
+        return [{'name': 'ReportProcessor.extract_text', 'skipped': str(e)}]
+
+    processor = report_processor(None, None, patterns)
+    return [measure('ReportProcessor.extract_text', processor.extract_text, names, repeat)]
+
+
+def git_commit():
+    """
+    Function for getting the current commit of the repository, None outside of git
+    """
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current):
+    """
+    Function for comparing the mean times of two runs: ratio above 1 means the current run is slower
+    """
+    baseline_means = {result['name']: result['mean_us'] for result in baseline['results'] if 'mean_us' in result}
+    comparison = []
+    for result in current['results']:
+        before = baseline_means.get(result['name'])
+        if before and 'mean_us' in result:
+            comparison.append({'name': result['name'], 'baseline_us': before, 'mean_us': result['mean_us'],
+                               'ratio': round(result['mean_us'] / before, 3)})
+    return comparison
+
+
+def run(dictionary='dictionary.xlsx', count=500, size=0, noise=0.0, seed=0, repeat=3, only=None):
+    """
+    Function for running the benchmark suite on a synthetic corpus; returns the report as a dict
+    """
+    applications = generate_applications(count, size, noise, seed)
+    names = generate_counterparties(count, noise, seed)
+    dictionaries = load_dictionaries(dictionary)
+    processor = ApplicationProcessor(None, None, None, None, dictionaries=dictionaries)
+
+    results = (benchmark_extractors(processor, applications, repeat, only)
+               + benchmark_end_to_end(dictionaries, applications, repeat, only)
+               + benchmark_report(names, repeat, only))
+
+    return {'meta': {'time': datetime.now().isoformat(timespec='seconds'),
+                     'commit': git_commit(),
+                     'python': platform.python_version(),
+                     'platform': platform.platform(),
+                     'corpus': {'count': count, 'size': size, 'noise': noise, 'seed': seed},
+                     'repeat': repeat},
+            'results': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Замеры скорости разбора заявок, результат в JSON')
+    parser.add_argument('--count', type=int, default=500, help='число синтетических заявок')
+    parser.add_argument('--size', type=int, default=0, help='число дополнительных строк в заявке')
+    parser.add_argument('--noise', type=float, default=0.0, help='вероятность искажений, от 0 до 1')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора')
+    parser.add_argument('--repeat', type=int, default=3, help='число проходов по корпусу')
+    parser.add_argument('--only', nargs='+', help='замерять только эти функции')
+    parser.add_argument('--dictionary', default='dictionary.xlsx', help='справочники')
+    parser.add_argument('--output', help='файл для результата (по умолчанию stdout)')
+    parser.add_argument('--compare', help='результат прошлого запуска для сравнения')
+    args = parser.parse_args(argv)
+
+    report = run(args.dictionary, args.count, args.size, args.noise, args.seed, args.repeat, args.only)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            report['comparison'] = compare(json.load(file), report)
+        for row in report['comparison']:
+            print(f"{row['name']:<30} {row['baseline_us']:>10.2f} -> {row['mean_us']:>10.2f} мкс  "
+                  f"x{row['ratio']:.2f}", file=sys.stderr)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text + '\n')
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
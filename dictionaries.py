@@ -0,0 +1,495 @@
+import hashlib
+import heapq
+import os
+import pickle
+import re
+import sys
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over a set of keywords: finds every keyword occurring in a text in one scan
+    """
+    def __init__(self, keywords):
+        """
+        keywords: iterable of (keyword, value) pairs; a value is reported for every occurrence of its keyword
+        """
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [[]]
+
+        for keyword, value in keywords:
+            state = 0
+            for char in keyword:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.output.append([])
+                state = next_state
+            self.output[state].append(value)
+
+        # breadth-first pass linking every state to its longest proper suffix in the trie
+        queue = list(self.goto[0].values())
+        for state in queue:
+            for char, next_state in self.goto[state].items():
+                fallback = self.fail[state]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[next_state] = self.goto[fallback].get(char, 0)
+                self.output[next_state] = self.output[next_state] + self.output[self.fail[next_state]]
+                queue.append(next_state)
+
+    def iter_values(self, text):
+        """
+        Method for getting the values of all keywords occurring in the text, in the order their ends are met
+        """
+        goto, fail, output = self.goto, self.fail, self.output
+        yield from output[0]
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                yield from output[state]
+
+    def first(self, text):
+        """
+        Method for getting the smallest value among the keywords occurring in the text, None if there are none
+        """
+        best = None
+        for value in self.iter_values(text):
+            if best is None or value < best:
+                best = value
+                if best == 0:
+                    break
+        return best
+
+
+def normalize(text):
+    """
+    Function for normalizing dictionary keys and texts the same way: lowercase without spaces
+    """
+    return text.lower().replace(' ', '')
+
+
+def exact(text):
+    """
+    Function for keys matched as they are written (the units: 'Т' is not 'т')
+    """
+    return text
+
+
+def normalize_product(text):
+    """
+    Function for normalizing product names: also treats the decimal comma and point alike (42,5 and 42.5)
+    """
+    return normalize(text).replace(',', '.')
+
+
+class LookupTable:
+    """
+    Dictionary sheet compiled into a hash map on normalized keys, the first row of a key wins
+    """
+    def __init__(self, rows, key=normalize):
+        """
+        rows: (data, value) pairs in the order of the sheet
+        """
+        self.key = key
+        self.values = {}
+        for data, value in rows:
+            if isinstance(data, str):
+                self.values.setdefault(key(data), value)
+
+    def get(self, data, default=None):
+        """
+        Method for getting the value of the data, default if the dictionary has no such key
+        """
+        if not isinstance(data, str):
+            return default
+        return self.values.get(self.key(data), default)
+
+
+def fuzzy_key(text):
+    """
+    Function for normalizing texts for the approximate matching: also ё as е and without punctuation (МСУ-1 and МСУ1)
+    """
+    return re.sub(r'[\W_]', '', normalize(text).replace('ё', 'е'))
+
+
+def ngrams(key, n=3, pad=True):
+    """
+    Function for the set of n-grams of a normalized key; padded, its beginning and end count as well
+    """
+    if pad:
+        key = f" {key} "
+    return frozenset(key[position:position + n] for position in range(max(1, len(key) - n + 1)))
+
+
+class TrigramIndex:
+    """
+    Keys indexed by their trigrams for the approximate matching. A search scores only the keys found in the postings
+    of the rarest trigrams of the query and reads at most budget postings, so its time stays flat as the keys grow
+    """
+    def __init__(self, keys=(), pad=True, budget=2000):
+        """
+        pad: the trigrams of the beginning and the end of the keys are kept (off for keys searched inside a text)
+        """
+        self.pad = pad
+        self.budget = budget
+        # trigrams of every key in the order they were added
+        self.grams = []
+        # trigram -> positions of the keys having it
+        self.postings = {}
+        for key in keys:
+            self.add(key)
+
+    def __len__(self):
+        return len(self.grams)
+
+    def add(self, key):
+        """
+        Method for adding a key, returns its position
+        """
+        grams = ngrams(key, pad=self.pad)
+        position = len(self.grams)
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(position)
+        self.grams.append(grams)
+        return position
+
+    def candidates(self, grams):
+        """
+        Method for the positions of the keys sharing the rarest trigrams of the query, within the budget
+        """
+        found = set()
+        scanned = 0
+        for postings in sorted((self.postings[gram] for gram in grams if gram in self.postings), key=len):
+            if scanned and scanned + len(postings) > self.budget:
+                break
+            found.update(postings)
+            scanned += len(postings)
+        return found
+
+    def search(self, key, limit=5, min_score=0.0, containment=False, grams=None):
+        """
+        Method for ranking the keys similar to the key: [(position, score)] from the best, the earlier key
+        first on a tie. The score is the Dice coefficient of the trigram sets, or with containment the share of
+        the trigrams of the indexed key found in the query (for keys occurring inside a text).
+        limit: number of the best keys returned, all of them with None;
+        grams: the trigrams of the key when they are already made
+        """
+        if grams is None:
+            grams = ngrams(key, pad=self.pad)
+        scored = []
+        for position in self.candidates(grams):
+            own = self.grams[position]
+            common = len(grams & own)
+            score = common / len(own) if containment else 2 * common / (len(grams) + len(own))
+            if score >= min_score:
+                scored.append((-score, position))
+        ranked = sorted(scored) if limit is None else heapq.nsmallest(limit, scored)
+        return [(position, round(-score, 3)) for score, position in ranked]
+
+
+def product_numbers(text):
+    """
+    Function for the numbers of a product name in order (the grade, the fraction), the decimal comma as a point
+    """
+    return tuple(re.findall(r'\d+(?:\.\d+)?', text.replace(',', '.')))
+
+
+class ProductIndex:
+    """
+    Products sheet compiled into a hash map of the normalized names and a trigram index over them.
+    Only the exact match names the product of the register; the trigram match is a suggestion with its score:
+    only the products with the same numbers (42,5 is not 52,5, 5-20 is not 20-40) sharing trigrams with the name
+    are scored (Dice coefficient of the trigram sets), the first row of the sheet wins a tie
+    """
+    def __init__(self, products, min_score=0.75):
+        """
+        products: product names in the order of the sheet;
+        min_score: the lowest similarity a suggestion is made with
+        """
+        self.min_score = min_score
+        self.table = LookupTable(zip(products, products), key=normalize_product)
+        self.products = []
+        self.numbers = []
+        self.trigrams = TrigramIndex()
+        seen = set()
+        for product in products:
+            if not isinstance(product, str) or normalize_product(product) in seen:
+                continue
+            key = normalize_product(product)
+            seen.add(key)
+            self.trigrams.add(key)
+            self.products.append(product)
+            self.numbers.append(product_numbers(product))
+
+    def get(self, data, default=None):
+        """
+        Method for getting the product of the data by the exact normalized name, default if there is none
+        """
+        return self.table.get(data, default)
+
+    def match(self, data):
+        """
+        Method for getting the product closest to the data with the same numbers and its similarity from 0 to 1,
+        (None, 0.0) when there is none
+        """
+        if not isinstance(data, str):
+            return None, 0.0
+        exact = self.table.get(data)
+        if exact is not None:
+            return exact, 1.0
+
+        numbers = product_numbers(data)
+        for position, score in self.trigrams.search(normalize_product(data), limit=None):
+            if self.numbers[position] == numbers:
+                return self.products[position], score
+        return None, 0.0
+
+    def suggest(self, data):
+        """
+        Method for the product suggested for the data and its score, (None, 0.0) if no product is similar enough
+        """
+        product, score = self.match(data)
+        return (product, score) if score >= self.min_score else (None, 0.0)
+
+
+class AddressHistory:
+    """
+    Distinct addresses written earlier (the consignee legal addresses of the register) indexed by trigrams,
+    for ranking the earlier addresses similar to a new one
+    """
+    def __init__(self, addresses=(), min_score=0.5):
+        self.min_score = min_score
+        self.addresses = []
+        self.keys = set()
+        self.trigrams = TrigramIndex()
+        self.extend(addresses)
+
+    def extend(self, addresses):
+        """
+        Method for adding addresses, the ones already known (up to case, spaces and punctuation) are skipped
+        """
+        for address in addresses:
+            if not isinstance(address, str):
+                continue
+            key = fuzzy_key(address)
+            if key and key not in self.keys:
+                self.keys.add(key)
+                self.trigrams.add(key)
+                self.addresses.append(address)
+
+    def candidates(self, address, limit=5):
+        """
+        Method for the earlier addresses similar to the address: [(address, score)] from the best
+        """
+        if not isinstance(address, str) or not fuzzy_key(address):
+            return []
+        return [(self.addresses[position], score)
+                for position, score in self.trigrams.search(fuzzy_key(address), limit, self.min_score)]
+
+
+class ManagerIndex:
+    """
+    Managers sheet compiled into an automaton over the normalized logins, the first row of the sheet wins
+    """
+    def __init__(self, rows):
+        """
+        rows: (login, manager) pairs in the order of the sheet
+        """
+        self.managers = []
+        # (normalized login, row) pairs
+        self.keywords = []
+        for login, manager in rows:
+            if isinstance(login, str):
+                self.keywords.append((normalize(login), len(self.managers)))
+            self.managers.append(manager)
+        self.automaton = KeywordAutomaton(self.keywords)
+
+    def find(self, compact_text):
+        """
+        Method for getting the manager whose login occurs in the normalized text, None if there is none
+        """
+        found = self.automaton.first(compact_text)
+        return self.managers[found] if found is not None else None
+
+
+class UnloadAddressIndex:
+    """
+    Unload addresses sheet compiled into one automaton over the normalized names and places.
+    A row matches when both its name and its place occur in the text, the first row of the sheet wins
+    """
+    def __init__(self, rows, min_score=0.8):
+        """
+        rows: (name, place, address) triples in the order of the sheet;
+        min_score: the lowest share of the trigrams of a name and of a place an approximate candidate needs
+        """
+        self.min_score = min_score
+        self.addresses = []
+        # (normalized name, normalized place, row) triples
+        self.keywords = []
+        for name, place, address in rows:
+            row = len(self.addresses)
+            if isinstance(name, str) and isinstance(place, str) and normalize(name):
+                self.keywords.append((normalize(name), normalize(place), row))
+            self.addresses.append(address)
+        self.automaton = KeywordAutomaton([keyword for name, place, row in self.keywords
+                                           for keyword in ((name, (row, 'name')), (place, (row, 'place')))])
+        # trigrams of the names and the places in the order of the keywords, for texts with typos
+        self.names = TrigramIndex((fuzzy_key(name) for name, place, row in self.keywords), pad=False)
+        self.places = TrigramIndex((fuzzy_key(place) for name, place, row in self.keywords), pad=False)
+
+    def find(self, compact_text):
+        """
+        Method for getting the address whose name and place both occur in the normalized text, None if there is none
+        """
+        names = set()
+        places = set()
+        for row, kind in self.automaton.iter_values(compact_text):
+            (names if kind == 'name' else places).add(row)
+        rows = names & places
+        return self.addresses[min(rows)] if rows else None
+
+    def candidates(self, name_text, place_text, limit=5, min_score=None):
+        """
+        Method for ranking the rows whose name approximately occurs in name_text and whose place approximately
+        occurs in place_text: [(address, score)] from the best, the score of a row is the lower of its name and
+        place scores. The texts are the items of an application (the consignee, the unload point), not all of it,
+        so that the trigrams of unrelated items do not make up a row
+        """
+        min_score = self.min_score if min_score is None else min_score
+        names = dict(self.names.search(None, None, min_score, containment=True,
+                                       grams=ngrams(fuzzy_key(name_text), pad=False)))
+        places = dict(self.places.search(None, None, min_score, containment=True,
+                                         grams=ngrams(fuzzy_key(place_text), pad=False)))
+        scored = sorted((-min(names[position], places[position]), self.keywords[position][2])
+                        for position in names.keys() & places.keys())
+        return [(self.addresses[row], -score) for score, row in scored[:limit]]
+
+
+class Dictionaries:
+    """
+    Dictionary sheets compiled for the lookups of ApplicationProcessor
+    """
+    def __init__(self, managers, units, unload_addresses, products=None):
+        """
+        Every sheet is a mapping of the column name to the column values (a dataframe works as well)
+        """
+        self.manager_index = ManagerIndex(zip(managers['login'], managers['manager']))
+        self.unload_address_index = UnloadAddressIndex(zip(unload_addresses['name'],
+                                                           unload_addresses['place'],
+                                                           unload_addresses['address']))
+        self.unit_table = LookupTable(zip(units['data'], units['unit']), key=exact)
+        self.product_index = ProductIndex(list(products['product']) if products is not None else [])
+
+
+def read_sheets(path, sheet_names):
+    """
+    Function for reading workbook sheets as {sheet: {column: values}} with a read-only row iterator
+    """
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        sheets = {}
+        for sheet_name in sheet_names:
+            if sheet_name not in workbook.sheetnames:
+                continue
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            header = next(rows, ())
+            columns = {name: [] for name in header if name is not None}
+            for row in rows:
+                if all(value is None for value in row):
+                    continue
+                for name, value in zip(header, row):
+                    if name is not None:
+                        columns[name].append(value)
+            sheets[sheet_name] = columns
+        return sheets
+    finally:
+        workbook.close()
+
+
+SNAPSHOT_VERSION = 6
+DICTIONARY_SHEETS = ['managers', 'units', 'unload_addresses', 'products']
+
+
+def file_hash(path):
+    """
+    Function for getting the sha256 of a file's content
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def build_snapshot(path, snapshot_path=None):
+    """
+    Function for compiling the dictionary workbook and saving the result as a binary snapshot next to it
+    """
+    snapshot_path = snapshot_path or path + '.snapshot'
+    stat = os.stat(path)
+    source_hash = file_hash(path)
+    sheets = read_sheets(path, DICTIONARY_SHEETS)
+    dictionaries = Dictionaries(sheets['managers'], sheets['units'], sheets['unload_addresses'],
+                                sheets.get('products'))
+
+    save_snapshot(snapshot_path, {'version': SNAPSHOT_VERSION,
+                                  'mtime_ns': stat.st_mtime_ns,
+                                  'size': stat.st_size,
+                                  'hash': source_hash,
+                                  'dictionaries': dictionaries})
+    return dictionaries
+
+
+def save_snapshot(snapshot_path, snapshot):
+    """
+    Function for writing a snapshot atomically, so that a concurrent start never reads half of it
+    """
+    temporary_path = f'{snapshot_path}.{os.getpid()}.tmp'
+    with open(temporary_path, 'wb') as file:
+        pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temporary_path, snapshot_path)
+
+
+def load_dictionaries(path='dictionary.xlsx', snapshot_path=None):
+    """
+    Function for loading the compiled dictionaries: the snapshot is reused while the workbook's mtime and size
+    (or, when they changed, its content hash) are the same, otherwise it is rebuilt
+    """
+    snapshot_path = snapshot_path or path + '.snapshot'
+    try:
+        with open(snapshot_path, 'rb') as file:
+            snapshot = pickle.load(file)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+        return build_snapshot(path, snapshot_path)
+
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return build_snapshot(path, snapshot_path)
+
+    stat = os.stat(path)
+    if (stat.st_mtime_ns, stat.st_size) == (snapshot['mtime_ns'], snapshot['size']):
+        return snapshot['dictionaries']
+    if file_hash(path) == snapshot['hash']:
+        # the workbook was only touched: remember its new mtime to skip hashing next time
+        snapshot.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        save_snapshot(snapshot_path, snapshot)
+        return snapshot['dictionaries']
+    return build_snapshot(path, snapshot_path)
+
+
+if __name__ == '__main__':
+    # the classes are pickled under the module name the processors import them by, not as __main__
+    import dictionaries
+
+    for workbook_path in sys.argv[1:] or ['dictionary.xlsx']:
+        dictionaries.build_snapshot(workbook_path)
+        print(f"{workbook_path}.snapshot")
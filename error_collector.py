@@ -0,0 +1,94 @@
+import traceback
+
+
+class ErrorCollector:
+    """
+    Error log of the processing buffered in a list and flushed to the 'ошибки' sheet once per batch.
+    Errors are counted by source (an extractor or a field) and exception type; only the first few of every
+    kind keep their full traceback, the rest are recorded with the message only
+    """
+    columns = ['Ошибка', 'Заявка']
+    summary_columns = ['Источник', 'Тип ошибки', 'Количество', 'Пример']
+
+    def __init__(self, samples=3, bare=False):
+        """
+        samples: number of full tracebacks kept for every source and exception type;
+        bare: records are made as tuples for the collector of another process to count (see replay)
+        """
+        self.samples = samples
+        self.bare = bare
+        # error records ({'Ошибка': ..., 'Заявка': ...}) not yet flushed
+        self.records = []
+        # (source, exception type) -> [count, first message]
+        self.counts = {}
+
+    def __len__(self):
+        return len(self.records)
+
+    def count(self, source, kind, message):
+        """
+        Method for counting an error of the source and exception type, returns how many of its kind there are
+        """
+        counted = self.counts.get((source, kind))
+        if counted is None:
+            counted = self.counts[(source, kind)] = [0, message]
+        counted[0] += 1
+        return counted[0]
+
+    @staticmethod
+    def make(message, trace, application):
+        return {'Ошибка': message if trace is None else f"{message}\n{trace}", 'Заявка': application}
+
+    def record(self, source, error, application):
+        """
+        Method for counting an error and making its record, without buffering it.
+        A bare record is (source, exception type, message, traceback or None, application)
+        """
+        kind = type(error).__name__
+        message = f"Error in {source}: {kind}: {error}"
+        trace = None
+        if self.count(source, kind, message) <= self.samples:
+            trace = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+        application = getattr(application, 'text', application)
+        if self.bare:
+            return source, kind, message, trace, application
+        return self.make(message, trace, application)
+
+    def replay(self, bare):
+        """
+        Method for counting a bare record of another collector and making its record as record() would make it
+        here: the traceback is kept only if the error is among the first few of its kind in this collector.
+        Every error among the first few here is among the first few of the other collector, so it has one
+        """
+        source, kind, message, trace, application = bare
+        if self.count(source, kind, message) > self.samples:
+            trace = None
+        return self.make(message, trace, application)
+
+    def add(self, source, error, application):
+        """
+        Method for counting an error of the application and buffering its record
+        """
+        self.records.append(self.record(source, error, application))
+
+    def extend(self, records):
+        """
+        Method for buffering records made elsewhere (by record() or by hand)
+        """
+        self.records.extend(records)
+
+    def drain(self, start=0):
+        """
+        Method for taking the buffered records from start on (all of them by default), leaving the earlier ones
+        """
+        records, self.records = self.records[start:], self.records[:start]
+        return records
+
+    def summary(self):
+        """
+        Method for getting the counts as rows of the summary, the most frequent errors first
+        """
+        rows = [dict(zip(self.summary_columns, (source, kind, count, message)))
+                for (source, kind), (count, message) in self.counts.items()]
+        rows.sort(key=lambda row: row['Количество'], reverse=True)
+        return rows
@@ -0,0 +1,122 @@
+import json
+import sys
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+
+# upper bounds of the latency histogram buckets, in microseconds; the last bucket is everything above
+BUCKETS_US = (10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+
+
+class Timings:
+    """
+    Call counts, cumulative time, maximum and latency histogram per name (a field, a register operation)
+    """
+    bounds = tuple(bound * 1000 for bound in BUCKETS_US)
+    labels = [f'le_{bound}us' for bound in BUCKETS_US] + [f'gt_{BUCKETS_US[-1]}us']
+
+    def __init__(self):
+        # name -> [calls, total ns, max ns, histogram]
+        self.stats = {}
+
+    def add(self, name, elapsed):
+        """
+        Method for recording one call of the name that took elapsed nanoseconds
+        """
+        stat = self.stats.get(name)
+        if stat is None:
+            stat = self.stats[name] = [0, 0, 0, [0] * len(self.labels)]
+        stat[0] += 1
+        stat[1] += elapsed
+        if elapsed > stat[2]:
+            stat[2] = elapsed
+        stat[3][bisect_left(self.bounds, elapsed)] += 1
+
+    @contextmanager
+    def timed(self, name):
+        """
+        Method for recording the time of a with-block under the name
+        """
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter_ns() - started)
+
+    def merge(self, stats):
+        """
+        Method for adding the stats of another Timings (of a pool process)
+        """
+        for name, (calls, total, longest, histogram) in stats.items():
+            stat = self.stats.get(name)
+            if stat is None:
+                stat = self.stats[name] = [0, 0, 0, [0] * len(self.labels)]
+            stat[0] += calls
+            stat[1] += total
+            stat[2] = max(stat[2], longest)
+            stat[3] = [own + other for own, other in zip(stat[3], histogram)]
+
+    def summary(self):
+        """
+        Method for getting the stats as a list of dicts, the most expensive names first
+        """
+        rows = []
+        for name, (calls, total, longest, histogram) in self.stats.items():
+            rows.append({'name': name,
+                         'calls': calls,
+                         'total_ms': round(total / 1e6, 3),
+                         'mean_us': round(total / calls / 1e3, 3) if calls else 0.0,
+                         'max_us': round(longest / 1e3, 3),
+                         'histogram': dict(zip(self.labels, histogram))})
+        rows.sort(key=lambda row: row['total_ms'], reverse=True)
+        return rows
+
+    def report(self, stream=sys.stderr):
+        """
+        Method for printing the summary as a table
+        """
+        for row in self.summary():
+            print(f"{row['name']:<22} {row['calls']:>8} {row['total_ms']:>12.1f} мс "
+                  f"{row['mean_us']:>10.1f} мкс {row['max_us']:>12.1f} мкс", file=stream)
+
+    def save(self, path):
+        """
+        Method to save the summary next to the output workbook: a sheet for .xlsx, JSON otherwise
+        """
+        if path.endswith('.xlsx'):
+            import pandas as pd
+
+            rows = [dict({key: value for key, value in row.items() if key != 'histogram'}, **row['histogram'])
+                    for row in self.summary()]
+            pd.DataFrame(rows).to_excel(path, sheet_name='timings', index=False)
+            return
+
+        with open(path, 'w', encoding='utf-8') as file:
+            json.dump(self.summary(), file, ensure_ascii=False, indent=2)
+
+
+def timed(timings, name):
+    """
+    Function for timing a with-block when the timings are enabled, doing nothing otherwise
+    """
+    return timings.timed(name) if timings is not None else nullcontext()
+
+
+@contextmanager
+def profiled(path):
+    """
+    Context manager running the block under cProfile and dumping the stats to the path (no-op without a path)
+    """
+    if path is None:
+        yield
+        return
+
+    import cProfile
+
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(path)
@@ -0,0 +1,211 @@
+import sqlite3
+import threading
+
+
+def quote(name):
+    """
+    Function for quoting a column name for SQL
+    """
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+def to_sql_value(value):
+    """
+    Function for converting an extracted value into a value SQLite can store (NaN becomes NULL)
+    """
+    if hasattr(value, 'item'):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def expand_trips(frame, column='Рейсов'):
+    """
+    Function for expanding register rows (one per application) into one row per trip with a vectorized repeat;
+    rows without a number of trips are one trip. Every expanded row is one trip, so expanding again changes nothing
+    """
+    if column not in frame.columns:
+        return frame.reset_index(drop=True)
+    trips = frame[column].astype(float).fillna(1).astype(int)
+    expanded = frame.loc[frame.index.repeat(trips)].reset_index(drop=True)
+    expanded[column] = 1
+    return expanded
+
+
+def collapse_trips(frame, id_column='№ Заявки', column='Рейсов'):
+    """
+    Function for collapsing the rows per trip of an exported register back into one row per application,
+    the inverse of expand_trips: the rows of one number are one application and their trips are summed.
+    Rows without a number and registers with a row per number are left as they are
+    """
+    if id_column not in frame.columns:
+        return frame
+    numbers = frame[id_column]
+    numbered = numbers.notna()
+    if not numbers[numbered].duplicated().any():
+        return frame
+
+    trips = frame[column].astype(float).fillna(1) if column in frame.columns else numbers.isna() * 0.0 + 1
+    sums = trips[numbered].groupby(numbers[numbered]).sum()
+    collapsed = frame[~(numbered & numbers.duplicated())].copy()
+    collapsed[column] = trips
+    first = collapsed[id_column].notna()
+    collapsed.loc[first, column] = collapsed.loc[first, id_column].map(sums)
+    collapsed[column] = collapsed[column].astype(int)
+    return collapsed.reset_index(drop=True)
+
+
+class NumberAllocator:
+    """
+    Monotonic allocator of the application numbers of a register kept as a dataframe: a number is given once and
+    never reused, the numbers of a loaded register are continued. Processes appending at the same time
+    use the store, whose AUTOINCREMENT gives the numbers in the inserting transaction
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last = 0
+
+    def allocate(self, count, at_least=0):
+        """
+        Method for taking count consecutive numbers, all of them above at_least (the largest number in use)
+        """
+        with self.lock:
+            first = max(self.last, at_least) + 1
+            self.last = first + count - 1
+        return list(range(first, first + count))
+
+
+class RegisterStore:
+    """
+    Append-only register of the applications in SQLite, indexed by date, manager and consignee.
+    An application is one row with its number of trips, the rows per trip are made only by query and export.
+    The numbers come from AUTOINCREMENT: given in the inserting transaction and never reused.
+    The Excel workbook is only an export of the store
+    """
+    id_column = '№ Заявки'
+    trips_column = 'Рейсов'
+    error_columns = ['Ошибка', 'Заявка']
+    indexes = {'applications_date': 'Дата',
+               'applications_manager': 'Менеджер',
+               'applications_consignee': 'Грузополучатель'}
+
+    def __init__(self, path, columns):
+        """
+        columns: register columns besides the application number, new ones are added to an existing store
+        """
+        self.path = path
+        self.columns = list(columns)
+        # the connection may be used from a worker thread, callers serialize the access
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        # write-ahead log: appending a small batch does not rewrite the database pages
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS applications '
+                                    f'({quote(self.id_column)} INTEGER PRIMARY KEY AUTOINCREMENT)')
+            existing = {row[1] for row in self.connection.execute('PRAGMA table_info(applications)')}
+            for column in self.columns:
+                if column not in existing:
+                    self.connection.execute(f'ALTER TABLE applications ADD COLUMN {quote(column)}')
+            for index, column in self.indexes.items():
+                self.connection.execute(f'CREATE INDEX IF NOT EXISTS {index} ON applications ({quote(column)})')
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS errors (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                                    f'{", ".join(quote(column) for column in self.error_columns)})')
+
+    def close(self):
+        self.connection.close()
+
+    def count(self):
+        """
+        Method for getting the number of rows in the register
+        """
+        return self.connection.execute('SELECT COUNT(*) FROM applications').fetchone()[0]
+
+    def _insert(self, table, columns, rows):
+        """
+        Method for inserting rows in one transaction; returns the id of the last inserted row
+        """
+        sql = (f'INSERT INTO {table} ({", ".join(quote(column) for column in columns)}) '
+               f'VALUES ({", ".join("?" * len(columns))})')
+        with self.connection:
+            self.connection.executemany(sql, ([to_sql_value(row.get(column)) for column in columns]
+                                              for row in rows))
+            return self.connection.execute('SELECT last_insert_rowid()').fetchone()[0]
+
+    def append(self, rows):
+        """
+        Method for appending register rows (dicts by column) in one transaction, numbering them in order.
+        Returns the numbers of the rows: the transaction holds the write lock, so they are consecutive
+        """
+        rows = list(rows)
+        if not rows:
+            return []
+        last = self._insert('applications', self.columns, rows)
+        return list(range(last - len(rows) + 1, last + 1))
+
+    def append_errors(self, errors):
+        """
+        Method for appending error records (dicts with 'Ошибка' and 'Заявка') in one transaction
+        """
+        self._insert('errors', self.error_columns, errors)
+
+    def import_frame(self, applications_df, error_log=None):
+        """
+        Method for moving an existing register (the 'data' and 'ошибки' sheets) into the store, keeping its numbers.
+        The rows per trip of an exported register are collapsed back into one row per application
+        """
+        applications_df = collapse_trips(applications_df, self.id_column, self.trips_column)
+        columns = [self.id_column] + [column for column in self.columns if column in applications_df.columns]
+        self._insert('applications', columns, applications_df.to_dict('records'))
+        if error_log is not None:
+            self.append_errors(error_log.to_dict('records'))
+
+    def query(self, date=None, manager=None, consignee=None, expand=True):
+        """
+        Method for getting the register rows as a dataframe, filtered on the indexed columns.
+        expand: one row per trip, as the register workbook has them, instead of one row per application
+        """
+        import pandas as pd
+
+        conditions = []
+        params = []
+        for column, value in (('Дата', date), ('Менеджер', manager), ('Грузополучатель', consignee)):
+            if value is not None:
+                conditions.append(f'{quote(column)} = ?')
+                params.append(value)
+
+        sql = f'SELECT {", ".join(quote(column) for column in [self.id_column] + self.columns)} FROM applications'
+        if conditions:
+            sql += ' WHERE ' + ' AND '.join(conditions)
+        sql += f' ORDER BY {quote(self.id_column)}'
+        frame = pd.read_sql_query(sql, self.connection, params=params)
+        return expand_trips(frame, self.trips_column) if expand else frame
+
+    def values(self, column):
+        """
+        Method for getting the distinct values of a column in the order they first occur, without empty ones
+        """
+        sql = (f'SELECT {quote(column)} FROM applications WHERE {quote(column)} IS NOT NULL '
+               f'GROUP BY {quote(column)} ORDER BY MIN({quote(self.id_column)})')
+        return [row[0] for row in self.connection.execute(sql)]
+
+    def errors(self):
+        """
+        Method for getting the error log as a dataframe
+        """
+        import pandas as pd
+
+        sql = f'SELECT {", ".join(quote(column) for column in self.error_columns)} FROM errors ORDER BY id'
+        return pd.read_sql_query(sql, self.connection)
+
+    def export_excel(self, filename):
+        """
+        Method to export the register and the error log to Excel
+        """
+        import pandas as pd
+
+        with pd.ExcelWriter(filename) as writer:
+            self.query().to_excel(writer, sheet_name="data", index=False)
+            self.errors().to_excel(writer, sheet_name="ошибки", index=False)
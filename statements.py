@@ -0,0 +1,318 @@
+import numpy as np
+import pandas as pd
+
+STATEMENT_SHEET = 'Выписка по счёту'
+STATEMENT_COLUMNS = ['Date', 'Exp', 'Inc', 'Full_Name', 'INN', 'Purpose']
+
+
+def column_indexes(usecols):
+    """
+    Function for turning Excel column letters in the read_excel form ("A, C:F, K") into zero-based indexes
+    """
+    from openpyxl.utils import column_index_from_string
+
+    indexes = []
+    for part in usecols.split(','):
+        first, _, last = part.strip().partition(':')
+        start = column_index_from_string(first.strip())
+        stop = column_index_from_string(last.strip()) if last else start
+        indexes.extend(range(start - 1, stop))
+    return indexes
+
+
+def read_statement_chunks(paths, chunk_size=50000, sheet_name=STATEMENT_SHEET, header=10, skip=1,
+                          usecols="A, C:F, K", columns=STATEMENT_COLUMNS):
+    """
+    Function for reading bank statements row by row in chunks of chunk_size rows, without loading
+    the workbooks: yields dataframes of the columns Date, Exp, Inc, Full_Name, INN, Purpose.
+    paths: a statement file or several of them, read one after another.
+    header, skip: the header row (zero-based, as in read_excel) and the rows to skip under it
+    """
+    import openpyxl
+
+    if isinstance(paths, str):
+        paths = [paths]
+    indexes = column_indexes(usecols)
+    if len(indexes) != len(columns):
+        raise ValueError(f"{len(indexes)} columns in {usecols!r} for {len(columns)} names")
+
+    chunk = []
+    for path in paths:
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        try:
+            sheet = workbook[sheet_name]
+            # the dimensions written by the bank software are not trusted
+            sheet.reset_dimensions()
+            for row in sheet.iter_rows(min_row=header + 2 + skip, max_col=max(indexes) + 1, values_only=True):
+                values = [row[index] if index < len(row) else None for index in indexes]
+                if all(value is None for value in values):
+                    continue
+                chunk.append(values)
+                if len(chunk) == chunk_size:
+                    yield pd.DataFrame(chunk, columns=columns)
+                    chunk = []
+        finally:
+            workbook.close()
+
+    if chunk:
+        yield pd.DataFrame(chunk, columns=columns)
+
+
+def read_statements(paths, **kwargs):
+    """
+    Function for reading whole bank statements into one dataframe with the streaming reader
+    """
+    chunks = list(read_statement_chunks(paths, **kwargs))
+    if not chunks:
+        return pd.DataFrame(columns=kwargs.get('columns', STATEMENT_COLUMNS))
+    return pd.concat(chunks, ignore_index=True)
+
+
+class StatementWriter:
+    """
+    Workbook written row by row (openpyxl write-only mode), for the results of statement chunks that are never
+    kept whole: every append adds the rows of a dataframe to a sheet, the header is written with the first rows
+    """
+    def __init__(self, path):
+        import openpyxl
+
+        self.path = path
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.sheets = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a failed run does not leave a workbook that looks complete
+        if exc_type is None:
+            self.close()
+
+    def append(self, sheet_name, frame):
+        """
+        Method for adding the rows of the dataframe to the sheet; NaN is written as an empty cell
+        """
+        sheet = self.sheets.get(sheet_name)
+        if sheet is None:
+            sheet = self.sheets[sheet_name] = self.workbook.create_sheet(sheet_name)
+            sheet.append([str(column) for column in frame.columns])
+        for row in frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None):
+            sheet.append(row)
+
+    def close(self):
+        self.workbook.save(self.path)
+
+
+def normalize_inn(values):
+    """
+    Function for bringing INNs to strings of 10 or 12 digits: numbers read from Excel lose the '.0' and get back
+    the leading zero they lost, anything else becomes NaN
+    """
+    digits = (pd.Series(values, dtype=object).astype(str).str.strip()
+              .str.replace(r'\.0$', '', regex=True).str.replace(r'\D', '', regex=True))
+    length = digits.str.len()
+    digits = digits.mask(length.isin([9, 11]), digits.str.zfill(12).where(length == 11, digits.str.zfill(10)))
+    return digits.where(digits.str.len().isin([10, 12]))
+
+
+def name_key(values):
+    """
+    Function for the key of counterparty names: lower case, ё as е, no quotes or punctuation, single spaces
+    """
+    names = pd.Series(values, dtype=object)
+    keys = (names.str.lower().str.replace('ё', 'е', regex=False)
+            .str.replace(r'[^\w\s]', ' ', regex=True).str.split().str.join(' '))
+    return keys.where(keys != '')
+
+
+class AgentIndex:
+    """
+    Agents keyed by normalized INN with the normalized name as the fallback key, for joining statement rows
+    to the agents with hash lookups instead of searching the agents frame row by row.
+    The first agent of a key wins, as in the other dictionaries
+    """
+    def __init__(self, agents, inn_column='INN', name_column='Full_Name'):
+        self.agents = agents.reset_index(drop=True)
+        self.by_inn = self.key_index(normalize_inn(self.agents[inn_column]))
+        self.by_name = self.key_index(name_key(self.agents[name_column]))
+
+    @staticmethod
+    def key_index(keys):
+        """
+        Method for a hash index of the keys to the positions of their first agents, without empty keys
+        """
+        keys = keys.dropna()
+        keys = keys[~keys.duplicated()]
+        return pd.Series(keys.index, index=pd.Index(keys.to_numpy()))
+
+    def positions(self, inns, names):
+        """
+        Method for the positions of the agents of statement rows (-1 for rows without an agent)
+        and the key every row was matched by
+        """
+        positions = np.full(len(inns), -1)
+        matched_by = np.full(len(inns), None, dtype=object)
+        for index, keys, key in ((self.by_inn, normalize_inn(inns), 'INN'),
+                                 (self.by_name, name_key(names), 'Full_Name')):
+            missing = np.flatnonzero(positions < 0)
+            # missing keys are taken out so that NaN does not find an agent
+            keys = keys.iloc[missing]
+            present = keys.notna().to_numpy()
+            found = index.index.get_indexer(keys[present].to_numpy())
+            rows = missing[present][found >= 0]
+            positions[rows] = index.to_numpy()[found[found >= 0]]
+            matched_by[rows] = key
+        return positions, matched_by
+
+    def join(self, statement, inn_column='INN', name_column='Full_Name'):
+        """
+        Method for joining statement rows to their agents: returns the joined rows (the agent columns clashing
+        with the statement get the suffix '_agent', 'Matched_By' tells the key) and the unmatched rows apart
+        """
+        positions, matched_by = self.positions(statement[inn_column], statement[name_column])
+        matched = positions >= 0
+        agents = self.agents.take(positions[matched]).reset_index(drop=True)
+        agents.columns = [f'{column}_agent' if column in statement.columns else column for column in agents.columns]
+        joined = pd.concat([statement[matched].reset_index(drop=True), agents], axis=1)
+        joined['Matched_By'] = matched_by[matched]
+        return joined, statement[~matched]
+
+
+def join_agents(chunks, index, **kwargs):
+    """
+    Function for joining statement chunks to the agent index chunk by chunk: yields (joined, unmatched)
+    """
+    for chunk in chunks:
+        yield index.join(chunk, **kwargs)
+
+
+def to_kopecks(values):
+    """
+    Function for turning statement amounts (numbers or texts like '1 234,56') into integer kopecks, 0 for empty
+    """
+    values = pd.Series(values, dtype=object)
+    texts = values.map(lambda value: isinstance(value, str))
+    if texts.any():
+        values = values.copy()
+        values[texts] = (values[texts].str.replace(r'[\s\xa0]', '', regex=True)
+                         .str.replace(',', '.', regex=False))
+    amounts = pd.to_numeric(values, errors='coerce').to_numpy(dtype=float)
+    return np.nan_to_num(np.rint(amounts * 100)).astype(np.int64)
+
+
+class StatementRollup:
+    """
+    Income and expense of every counterparty per month, summed in one pass over the statement chunks.
+    Counterparties and months are factorized into integer codes and the amounts are kept in integer kopecks,
+    so the sums are exact; a month is a slice of the totals, not a reread of the statement
+    """
+    kinds = ['Inc', 'Exp']
+
+    def __init__(self):
+        # counterparty names in the order of their codes
+        self.counterparties = pd.Index([], dtype=object)
+        # partial sums of the chunks: counterparty code, month ordinal, Inc, Exp in kopecks
+        self.partials = []
+        # rows without a counterparty or a date
+        self.skipped = 0
+        self._months = None
+        self._totals = None
+
+    def add(self, chunk, names=None):
+        """
+        Method for adding a statement chunk; names: the counterparty of every row (the Full_Name column
+        by default), e.g. the normalized names
+        """
+        if names is None:
+            names = chunk['Full_Name']
+        dates = pd.to_datetime(chunk['Date'], dayfirst=True, errors='coerce')
+        codes, uniques = pd.factorize(names)
+
+        # the codes of the chunk are mapped to the codes of the whole statement, new names are appended
+        known = self.counterparties.get_indexer(uniques)
+        new = known < 0
+        known[new] = np.arange(len(self.counterparties), len(self.counterparties) + new.sum())
+        self.counterparties = self.counterparties.append(pd.Index(uniques[new], dtype=object))
+
+        valid = (codes >= 0) & dates.notna().to_numpy()
+        self.skipped += int((~valid).sum())
+        months = (dates.dt.year * 12 + dates.dt.month - 1).to_numpy()[valid].astype(np.int64)
+        partial = pd.DataFrame({'code': known[codes[valid]], 'month': months,
+                                'Inc': to_kopecks(chunk['Inc'])[valid], 'Exp': to_kopecks(chunk['Exp'])[valid]})
+        self.partials.append(partial.groupby(['code', 'month'], sort=False).sum())
+        self._totals = None
+        return self
+
+    @classmethod
+    def from_chunks(cls, chunks, key=None):
+        """
+        Method for summing the statement chunks; key: function of a chunk giving the counterparty of its rows
+        """
+        rollup = cls()
+        for chunk in chunks:
+            rollup.add(chunk, None if key is None else key(chunk))
+        return rollup
+
+    def _compute(self):
+        """
+        Method for summing the partials into the array of counterparties x months x (Inc, Exp) in kopecks
+        """
+        if self._totals is None:
+            sums = (pd.concat(self.partials).groupby(level=['code', 'month']).sum() if self.partials
+                    else pd.DataFrame(columns=self.kinds, index=pd.MultiIndex.from_arrays([[], []])))
+            codes = sums.index.get_level_values(0).to_numpy(dtype=np.int64)
+            ordinals = np.sort(sums.index.get_level_values(1).unique().to_numpy(dtype=np.int64))
+            totals = np.zeros((len(self.counterparties), len(ordinals), 2), dtype=np.int64)
+            totals[codes, np.searchsorted(ordinals, sums.index.get_level_values(1).to_numpy(dtype=np.int64))] = \
+                sums[self.kinds].to_numpy(dtype=np.int64)
+            self._months = pd.PeriodIndex([pd.Period(year=ordinal // 12, month=ordinal % 12 + 1, freq='M')
+                                          for ordinal in ordinals], freq='M')
+            self._totals = totals
+        return self._totals
+
+    @property
+    def months(self):
+        """
+        Months with payments, sorted
+        """
+        self._compute()
+        return self._months
+
+    @property
+    def totals(self):
+        """
+        Totals in kopecks: counterparties as rows, (month, Inc/Exp) as columns
+        """
+        totals = self._compute()
+        columns = pd.MultiIndex.from_product([self.months.astype(str), self.kinds], names=['Month', 'Kind'])
+        return pd.DataFrame(totals.reshape(len(self.counterparties), -1), index=self.counterparties,
+                            columns=columns)
+
+    def month(self, period, kopecks=False):
+        """
+        Method for the income and expense of the counterparties with payments in the month
+        (a pd.Period or 'YYYY-MM'), in rubles unless kopecks
+        """
+        totals = self._compute()
+        position = self.months.get_indexer([pd.Period(period, freq='M')])[0]
+        if position < 0:
+            return pd.DataFrame(columns=['Full_Name'] + self.kinds)
+        return self._frame(totals[:, position], kopecks)
+
+    def year(self, year, kopecks=False):
+        """
+        Method for the income and expense of the counterparties summed over the months of the year
+        """
+        totals = self._compute()
+        return self._frame(totals[:, self.months.year == year].sum(axis=1), kopecks)
+
+    def _frame(self, view, kopecks):
+        """
+        Method for a dataframe of the counterparties with payments in a view of the totals (counterparties x kinds)
+        """
+        paid = view.any(axis=1)
+        frame = pd.DataFrame(view[paid], columns=self.kinds)
+        if not kopecks:
+            frame = frame / 100
+        frame.insert(0, 'Full_Name', self.counterparties[paid])
+        return frame
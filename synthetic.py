@@ -0,0 +1,193 @@
+import argparse
+import random
+import sys
+
+MANAGERS = ['ИГО', 'Юра Менеджер', 'Алексей Мельхер', 'Марина Логист', 'Отдел продаж']
+HEADERS = ['', 'Заявка на доставку', 'Заявка на самовывоз', 'Заявка/наша доставка', 'Заявка на доставку (автономка)']
+PRODUCTS = ['ЦЕМ I 42,5н', 'ЦЕМ I 42.5Н БЦК', 'ЦЕМ I 42,5Н Костюковичи', 'ЦЕМ II/А-Ш 32,5Б', 'Цем I 42.5Н Кричев',
+            'Щебень гранитный 5-20(ЛСР)', 'ПЕСКОГРУНТ', 'Песок мытый']
+PRODUCT_NOTICES = ['Обязательно актуальный паспорт!', 'Сертификаты!', 'Навал', 'Без паспорта не выгружают']
+UNITS = ['тонн', 'т', 'т.', 'тн', 'кубов']
+SELLERS = ['ООО "Спарта"', 'ООО Спарта', 'ООО "СЗТК"', 'ООО "Арди-а"']
+TRANSSHIPMENTS = ['С Солнечногорска', 'С перевалки Люберцы', 'С псо 13', 'Завод отгрузки: БЦК', 'Перевалка: СЗТК']
+# consignee names and unload places of the dictionary, so that some applications find their unload address
+CONSIGNEES = [('Бетонная индустрия', 'Одинцово'), ('Бетон Строй', 'Солнечногорск'), ('МСУ-1', 'Бескудниковский'),
+              ('БетонПром', 'Октябрьский'), ('КАНТАН', 'Соколовское'), ('М Бетон', 'Очаковское'),
+              ('Стройресурс', 'Подольск'), ('НВЛ ГРУП', 'Химки')]
+STREETS = ['ул. Промышленная 1б', 'Кобяковская', 'Можайское ш., 81', 'ул. Старый двор, промзона', 'Бетас']
+TIMES = ['с 9.00 до 20.00', 'круглосуточно', 'с 8:00 до 17:00', 'до 18.00']
+NOTES = ['Дебет оплата 250', 'оплата: по факту', 'Оплата 100% предоплата']
+CHATTER = ['Сертификаты!', 'Обязательно актуальный паспорт!', 'Просьба позвонить за час', 'Машины с манипулятором',
+           'Въезд с проезда Стройкомбината', 'Пропуск заказан']
+PLATE_LETTERS = 'АВЕКМНОРСТУХ'
+REGIONS = ['750', '790', '797', '123', '777', '799']
+CAR_MODELS = ['MAN', 'МАN', 'КАМАЗ', 'Scania', 'Мурадов']
+
+SURNAMES = ['Иванов', 'Логинов', 'Воронов', 'Измайлов', 'Никишкин', 'Смирнов', 'Кузнецов', 'Попов']
+NAMES = ['Андрей', 'Илья', 'Валерий', 'Лидия', 'Сергей', 'Ольга', 'Михаил']
+PATRONYMICS = ['Николаевич', 'Андреевич', 'Михайлович', 'Алексеевна', 'Сергеевич', 'Петровна']
+COMPANIES = ['ГТС', 'ЛАГ1', 'Ромашка', 'БетонПром', 'Спарта', 'ОХРАННЫЕ СИСТЕМЫ', 'СЗТК']
+
+
+def make_plate(rng):
+    """
+    Function for making a Cyrillic car plate with a model or a driver after it (О327ВН790 MAN)
+    """
+    letters = rng.choices(PLATE_LETTERS, k=3)
+    return f"{letters[0]}{rng.randint(0, 999):03d}{letters[1]}{letters[2]}{rng.choice(REGIONS)} {rng.choice(CAR_MODELS)}"
+
+
+def make_phone(rng):
+    """
+    Function for making a phone number in one of the ways managers write them
+    """
+    digits = [rng.randint(0, 9) for _ in range(10)]
+    code, first, second, third = ''.join(map(str, digits[:3])), ''.join(map(str, digits[3:6])), \
+        ''.join(map(str, digits[6:8])), ''.join(map(str, digits[8:]))
+    return rng.choice([f"+7{code}{first}{second}{third}",
+                       f"8 ({code}) {first}-{second}-{third}",
+                       f"+7 {code} {first}-{second}-{third}",
+                       f"8-{code}-{first}-{second}-{third}"])
+
+
+def make_date(rng):
+    """
+    Function for making a shipment date as dd.mm, dd.mm.yy or dd.mm.yyyy
+    """
+    day, month = rng.randint(1, 28), rng.randint(1, 12)
+    return rng.choice([f"{day:02d}.{month:02d}", f"{day:02d}.{month:02d}.24", f"{day:02d}.{month:02d}.2024"])
+
+
+def add_noise(rng, line, noise):
+    """
+    Function for spoiling a line the way pasted applications are spoiled: case, spaces and punctuation
+    """
+    if rng.random() < noise:
+        line = rng.choice([line.upper(), line.lower(), line.capitalize()])
+    if rng.random() < noise:
+        line = line.replace(' ', '  ', 1)
+    if rng.random() < noise:
+        line = line.replace(': ', ' ', 1)
+    return line
+
+
+def generate_application(rng, size=0, noise=0.0):
+    """
+    Function for generating one application modeled on the samples: numbered items, cars, phones, remarks.
+    size: number of additional free lines (cars, phones, remarks); noise: probability of every distortion
+    """
+    consignee, place = rng.choice(CONSIGNEES)
+    unit = rng.choice(UNITS)
+    items = [f"Дата отгрузки{rng.choice([': ', ' ', ' на '])}{make_date(rng)}",
+             f"Марка{rng.choice([' цемента ', ': ', '  '])}{rng.choice(PRODUCTS)}",
+             f"{rng.choice(['Количество', 'Кол-во', 'Количество:'])} {35 * rng.randint(1, 6)} {unit}",
+             f"{rng.choice(['Продажа от ', 'От ', 'Продажа от клиента: '])}{rng.choice(SELLERS)}",
+             rng.choice(TRANSSHIPMENTS),
+             f"{rng.choice(['Покупатель ', 'Покупатель груза: '])}ООО \"{consignee}\"",
+             f"{rng.choice(['Грузополучатель ', 'Грузополучатель (при оформлении ТТН): '])}ООО \"{consignee}\"",
+             f"{rng.choice(['Юр. адрес грузополучателя: ', 'Адрес грузополучателя (юр.): '])}"
+             f"{rng.randint(100000, 999999)}, {place}, {rng.choice(STREETS)}",
+             f"{rng.choice(['Пункт разгрузки: ', 'Точка выгрузки: '])}{place}, {rng.choice(STREETS)}",
+             f"Время приёмки: {rng.choice(TIMES)}"]
+
+    if rng.random() < noise:
+        # items are left out or swapped by hand
+        del items[rng.randrange(3, len(items))]
+        first = rng.randrange(3, len(items) - 1)
+        items[first], items[first + 1] = items[first + 1], items[first]
+
+    lines = ['', f"{rng.choice(MANAGERS)}:", rng.choice(HEADERS)]
+    for number, item in enumerate(items, 1):
+        lines.append(add_noise(rng, f"{number}.{rng.choice([' ', '', '  '])}{item}", noise))
+        if number == 2 and rng.random() < 0.3:
+            lines.append(rng.choice(PRODUCT_NOTICES))
+
+    lines.append(make_phone(rng))
+    lines.append(rng.choice(NOTES))
+    lines.append(make_plate(rng))
+    for _ in range(size):
+        kind = rng.random()
+        lines.append(make_plate(rng) if kind < 0.5 else make_phone(rng) if kind < 0.7 else
+                     add_noise(rng, rng.choice(CHATTER), noise))
+
+    return '\\n'.join(lines) + '\\n'
+
+
+def generate_applications(count, size=0, noise=0.0, seed=0):
+    """
+    Function for generating a reproducible corpus of applications
+    """
+    rng = random.Random(seed)
+    return [generate_application(rng, size, noise) for _ in range(count)]
+
+
+def generate_counterparty(rng, noise=0.0):
+    """
+    Function for generating a counterparty name of an account statement in one of the forms ReportProcessor handles
+    """
+    surname, name, patronymic = rng.choice(SURNAMES), rng.choice(NAMES), rng.choice(PATRONYMICS)
+    company = rng.choice(COMPANIES)
+    full_name = rng.choice([f"ПАО {company}",
+                            f"ООО \"{company}\"",
+                            f"ООО \"ЧОП \"{company}\"",
+                            f"ПАО Р-БАНК//{surname} {name} {patronymic}//РОССИЯ,МОСКВА Г Р/С в ПАО Р-БАНК г Москва"
+                            .upper(),
+                            f"Индивидуальный ПРЕДПРИНИМАТЕЛЬ {surname} {name} {patronymic}",
+                            f"{surname} {name} {patronymic} (ИП)",
+                            f"{surname} {name} {patronymic}".upper(),
+                            f"УФК по г. Москве (ИФНС России № {rng.randint(1, 50)} по г. Москве)",
+                            f"ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ \"{company}\"",
+                            "Межрегиональное операционное УФК (КАЗНАЧЕЙСТВО РОССИИ)"])
+    return add_noise(rng, full_name, noise)
+
+
+def generate_counterparties(count, noise=0.0, seed=0):
+    """
+    Function for generating a reproducible list of counterparty names
+    """
+    rng = random.Random(seed)
+    return [generate_counterparty(rng, noise) for _ in range(count)]
+
+
+def generate_statement(path, count, noise=0.0, seed=0, sheet_name='Выписка по счёту'):
+    """
+    Function for writing a reproducible account statement in the layout of the bank: the header on the
+    eleventh row, the row of column numbers under it, Date, Exp, Inc, Full_Name, INN, Purpose in A, C:F, K
+    """
+    import openpyxl
+    from datetime import datetime, timedelta
+
+    rng = random.Random(seed)
+    names = {}
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(sheet_name)
+    for line in range(10):
+        sheet.append([f'Выписка по счёту, строка {line + 1}' if line == 0 else None])
+    sheet.append(['Дата', 'Документ', 'Дебет', 'Кредит', 'Контрагент', 'ИНН', None, None, None, None, 'Назначение'])
+    sheet.append(list(range(1, 12)))
+    start = datetime(2024, 1, 1)
+    for _ in range(count):
+        name = generate_counterparty(rng, noise)
+        inn = names.setdefault(name, str(rng.randint(10 ** 9, 10 ** 10 - 1)))
+        amount = round(rng.uniform(100, 500000), 2)
+        income = rng.random() < 0.5
+        sheet.append([start + timedelta(days=rng.randrange(366)), f'п/п {rng.randint(1, 9999)}',
+                      None if income else amount, amount if income else None, name, inn,
+                      None, None, None, None, rng.choice(NOTES)])
+    workbook.save(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Генерация синтетических заявок, по одной в строке')
+    parser.add_argument('count', type=int, help='число заявок')
+    parser.add_argument('--size', type=int, default=0, help='число дополнительных строк в заявке')
+    parser.add_argument('--noise', type=float, default=0.0, help='вероятность искажений, от 0 до 1')
+    parser.add_argument('--seed', type=int, default=0, help='зерно генератора')
+    args = parser.parse_args(argv)
+
+    for application in generate_applications(args.count, args.size, args.noise, args.seed):
+        sys.stdout.write(application + '\n')
+
+
+if __name__ == '__main__':
+    main()
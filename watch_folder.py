@@ -0,0 +1,155 @@
+import argparse
+import os
+import sys
+import time
+
+from applic import load_processor, open_store
+
+
+def read_application_file(path):
+    """
+    Function for reading an application file: real line breaks become \\n, the way they come from input()
+    """
+    with open(path, encoding='utf-8-sig') as file:
+        text = file.read()
+    text = text.replace('\r\n', '\n').replace('\n', '\\n')
+    if not text.endswith('\\n'):
+        text += '\\n'
+    return text
+
+
+def move_to(path, folder):
+    """
+    Function for moving a file into a folder without overwriting a file with the same name
+    """
+    name = os.path.basename(path)
+    target = os.path.join(folder, name)
+    if os.path.exists(target):
+        stem, extension = os.path.splitext(name)
+        target = os.path.join(folder, f"{stem}_{time.strftime('%Y%m%d%H%M%S')}_{os.getpid()}{extension}")
+    os.replace(path, target)
+    return target
+
+
+class FolderWatcher:
+    """
+    Long-running ingestion of the application files put into a folder, one application per file.
+    The folder is polled cheaply (its mtime first), files are taken once they stop changing,
+    a burst of files is processed as one batch and every file goes to the done or failed folder
+    """
+    def __init__(self, processor, folder, done=None, failed=None, batch_size=100, interval=1.0, settle=1.0):
+        self.processor = processor
+        self.folder = folder
+        self.done = done or os.path.join(folder, 'done')
+        self.failed = failed or os.path.join(folder, 'failed')
+        self.batch_size = batch_size
+        self.interval = interval
+        self.settle = settle
+        self.folder_mtime = None
+        self.pending = True
+
+        os.makedirs(self.done, exist_ok=True)
+        os.makedirs(self.failed, exist_ok=True)
+
+    def changed(self):
+        """
+        Method for checking whether the folder has to be listed: it changed or some files were still being written
+        """
+        mtime = os.stat(self.folder).st_mtime_ns
+        changed = mtime != self.folder_mtime or self.pending
+        self.folder_mtime = mtime
+        return changed
+
+    def ready_files(self):
+        """
+        Method for listing the files that are ready to be processed, the oldest first, at most one batch
+        """
+        now = time.time()
+        ready = []
+        self.pending = False
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.is_file() or entry.name.startswith('.') or entry.name.endswith('.tmp'):
+                    continue
+                mtime = entry.stat().st_mtime
+                if now - mtime < self.settle:
+                    self.pending = True
+                    continue
+                ready.append((mtime, entry.name, entry.path))
+
+        ready.sort()
+        if len(ready) > self.batch_size:
+            self.pending = True
+        return [path for mtime, name, path in ready[:self.batch_size]]
+
+    def process(self, paths):
+        """
+        Method for processing a batch of files and moving each one to the done or failed folder
+        """
+        texts = []
+        read = []
+        errors = []
+        for path in paths:
+            try:
+                texts.append(read_application_file(path))
+                read.append(path)
+            except (OSError, UnicodeDecodeError) as e:
+                errors.append({'Ошибка': f"Error reading the file {os.path.basename(path)}: {e}", 'Заявка': path})
+                move_to(path, self.failed)
+
+        self.processor.log_errors(errors)
+        stats = self.processor.process_many(texts)
+
+        failed = set(stats['failed'])
+        for index, path in enumerate(read):
+            move_to(path, self.failed if index in failed else self.done)
+
+        print(f"{time.strftime('%H:%M:%S')} файлов: {len(paths)}, строк: {stats['rows']}, "
+              f"ошибок: {stats['errors'] + len(errors)}, {stats['seconds']:.2f} с", file=sys.stderr)
+        return stats
+
+    def run_once(self):
+        """
+        Method for one poll of the folder; returns the number of processed files
+        """
+        if not self.changed():
+            return 0
+        paths = self.ready_files()
+        if paths:
+            self.process(paths)
+        return len(paths)
+
+    def run(self):
+        """
+        Method for watching the folder until interrupted
+        """
+        while True:
+            if not self.run_once():
+                time.sleep(self.interval)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Обработка заявок из папки')
+    parser.add_argument('folder', help='папка с входящими заявками, по одной в файле')
+    parser.add_argument('--done', help='папка для обработанных файлов (по умолчанию folder/done)')
+    parser.add_argument('--failed', help='папка для файлов с ошибками (по умолчанию folder/failed)')
+    parser.add_argument('--batch-size', type=int, default=100, help='сколько файлов обрабатывать за раз')
+    parser.add_argument('--interval', type=float, default=1.0, help='период опроса папки, с')
+    parser.add_argument('--store', default='appl_register.sqlite', help='хранилище реестра заявок (SQLite)')
+    parser.add_argument('--register', default='appl_register.xlsx', help='реестр заявок в Excel')
+    parser.add_argument('--dictionary', default='dictionary.xlsx', help='справочники')
+    args = parser.parse_args(argv)
+
+    store = open_store(args.store, args.register)
+    processor = load_processor(args.dictionary, store)
+    watcher = FolderWatcher(processor, args.folder, args.done, args.failed, args.batch_size, args.interval)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+import argparse
+import json
+import os
+import socketserver
+import sys
+import threading
+import time
+
+from applic import load_processor, open_store
+from register_store import to_sql_value
+
+
+class ApplicationWorker:
+    """
+    Resident worker keeping the compiled dictionaries and the register store open between requests.
+    A request is one JSON line:
+        {"id": 1, "text": "..."}                 - process an application and append it to the register
+        {"id": 2, "texts": ["...", "..."]}       - the same for a batch
+        {"id": 3, "text": "...", "columns": [...]} - only extract the columns, the register is not changed
+    and the answer is one JSON line with the same id, the extracted rows and the indexes of failed applications;
+    the errors of a columns request are returned in it, not written to the register
+    """
+    def __init__(self, processor):
+        self.processor = processor
+        self.lock = threading.Lock()
+
+    def process(self, texts, columns=None):
+        """
+        Method for extracting the rows of the applications, appending them to the register unless columns are given.
+        Returns the rows, the indexes of the failed applications and the error records of a columns request
+        """
+        with self.lock:
+            count, rows, errors, failed = self.processor.extract_batch(texts, columns)
+            if columns is not None:
+                # the errors the extractors buffered go back with the answer, not into the next appended batch
+                return rows, failed, self.processor.errors.drain() + list(errors)
+
+            numbers = self.processor.append_batch(rows, errors)
+            rows = [dict(row, **{'№ Заявки': number}) for row, number in zip(rows, numbers)]
+        return rows, failed, []
+
+    def handle(self, line):
+        """
+        Method for answering one request line with one response line
+        """
+        started = time.perf_counter()
+        request_id = None
+        try:
+            request = json.loads(line)
+            request_id = request.get('id')
+            texts = [request['text']] if 'text' in request else request['texts']
+            rows, failed, errors = self.process(texts, request.get('columns'))
+            response = {'id': request_id,
+                        'rows': [{column: to_sql_value(value) for column, value in row.items()} for row in rows],
+                        'failed': failed,
+                        'errors': errors}
+
+        except Exception as e:
+            response = {'id': request_id, 'error': f"{type(e).__name__}: {e}"}
+
+        response['ms'] = round((time.perf_counter() - started) * 1000, 2)
+        return json.dumps(response, ensure_ascii=False, default=str)
+
+    def serve_stream(self, stream_in, stream_out):
+        """
+        Method for serving requests from a text stream (stdin) until it ends
+        """
+        for line in stream_in:
+            if line.strip():
+                stream_out.write(self.handle(line) + '\n')
+                stream_out.flush()
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write((self.server.worker.handle(line.decode('utf-8')) + '\n').encode('utf-8'))
+
+
+class WorkerServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server of the worker: every connection is a stream of JSON lines
+    """
+    daemon_threads = True
+
+    def __init__(self, path, worker):
+        if os.path.exists(path):
+            os.remove(path)
+        self.worker = worker
+        super().__init__(path, _RequestHandler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Резидентный обработчик заявок (JSON lines)')
+    parser.add_argument('--socket', help='unix-сокет для запросов; без него запросы читаются из stdin')
+    parser.add_argument('--store', default='appl_register.sqlite', help='хранилище реестра заявок (SQLite)')
+    parser.add_argument('--register', default='appl_register.xlsx', help='реестр заявок в Excel')
+    parser.add_argument('--dictionary', default='dictionary.xlsx', help='справочники')
+    args = parser.parse_args(argv)
+
+    store = open_store(args.store, args.register)
+    worker = ApplicationWorker(load_processor(args.dictionary, store))
+    try:
+        if args.socket:
+            with WorkerServer(args.socket, worker) as server:
+                print(f"Ожидание запросов на {args.socket}", file=sys.stderr)
+                server.serve_forever()
+        else:
+            worker.serve_stream(sys.stdin, sys.stdout)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()